@@ -1,18 +1,224 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, make_response
 from flask_cors import CORS
+from datetime import datetime, timezone
+from functools import wraps
+import gzip
+import hmac
+import logging
 import os
 import sys
+import threading
+import time
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from retrieval_system import InformationRetrievalSystem
-from config import JSON_FILE, MODEL_DIR
+from concurrency import EncodeQueueFull
+from serialization import dumps
+from utils import configure_logging
+from config import (
+    JSON_FILE,
+    MODEL_DIR,
+    MAX_BATCH_QUERIES,
+    HTTP_CACHE_MAX_AGE,
+    HTTP_COMPRESS_MIN_BYTES,
+    HTTP_GZIP_LEVEL,
+    HTTP_BROTLI_QUALITY,
+)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 CORS(app)
 
-ir_system = InformationRetrievalSystem(model_path=MODEL_DIR)
-ir_system.load_collection(filepath=JSON_FILE)
+ADMIN_TOKEN = os.environ.get("IRUM_ADMIN_TOKEN")
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+ir_system = None
+_system_lock = threading.Lock()
+
+
+def load_system(warmup: bool = True, encode: bool = True) -> InformationRetrievalSystem:
+    # serve.py calls this before serving (and before forking workers, so they
+    # share the loaded model and matrices); otherwise the first request does.
+    global ir_system
+    if ir_system is None:
+        with _system_lock:
+            if ir_system is None:
+                system = InformationRetrievalSystem(model_path=MODEL_DIR)
+                system.load_collection(filepath=JSON_FILE)
+                if warmup:
+                    system.warmup(encode=encode)
+                ir_system = system
+    return ir_system
+
+
+def parse_projection(source):
+    fields = source.get("fields")
+    abstract_chars = source.get("abstract_chars")
+
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+    if fields is not None and not (
+        isinstance(fields, list) and all(isinstance(field, str) for field in fields)
+    ):
+        raise ValueError("Fields must be a list of field names")
+
+    if abstract_chars is not None:
+        abstract_chars = int(abstract_chars)
+        if abstract_chars < 0:
+            raise ValueError("abstract_chars must be non-negative")
+
+    return fields or None, abstract_chars
+
+
+def serialize_results(indices, scores, fields, abstract_chars) -> bytes:
+    with ir_system.monitor.span("serialization"):
+        fragments = ir_system.document_fragments(
+            indices.tolist(), fields, abstract_chars
+        )
+        return (
+            b"["
+            + b",".join(
+                b'{"document":' + fragment + b',"score":' + dumps(score) + b"}"
+                for fragment, score in zip(fragments, scores.tolist())
+            )
+            + b"]"
+        )
+
+
+def json_response(body: bytes) -> Response:
+    return Response(body, mimetype="application/json")
+
+
+def collection_validators():
+    version, modified = ir_system.collection_state()
+    etag = f"{version}-{int(modified * 1000):x}"
+    last_modified = datetime.fromtimestamp(int(modified), timezone.utc)
+    return etag, last_modified
+
+
+def conditional(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Validators are read before the body is built, so a response can only
+        # be tagged with a version at least as old as its content.
+        etag, last_modified = collection_validators()
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = (
+                request.if_modified_since is not None
+                and last_modified <= request.if_modified_since
+            )
+
+        if not_modified:
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag, weak=True)
+        response.last_modified = last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = HTTP_CACHE_MAX_AGE
+        response.cache_control.must_revalidate = True
+        return response
+
+    return wrapper
+
+
+@app.before_request
+def ensure_system_loaded():
+    load_system()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+    data = request.get_json(silent=True) if request.is_json else None
+    info = {"method": request.method, "path": request.full_path}
+    if isinstance(data, dict):
+        info.update(
+            {key: data[key] for key in ("query", "queries", "top_k") if key in data}
+        )
+
+    g.trace = ir_system.tracer.start(
+        request.endpoint or "not_found",
+        info,
+        # Forced tracing costs every request a trace; only admins may ask.
+        force=request.headers.get("X-IRUM-Trace") == "1" and admin_token_valid(),
+    )
+
+
+@app.after_request
+def finish_request_trace(response):
+    # Registered first, so it runs last and the trace covers every other hook.
+    trace, token = g.pop("trace", (None, None))
+    if trace is not None:
+        ir_system.tracer.finish(trace, token)
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-IRUM-Trace-Id"] = trace.trace_id
+    return response
+
+
+@app.teardown_request
+def discard_request_trace(error=None):
+    trace, token = g.pop("trace", (None, None))
+    if trace is not None:
+        ir_system.tracer.finish(trace, token)
+
+
+@app.after_request
+def record_request_latency(response):
+    # Registered before compress_response, so it runs after it and the
+    # recorded latency includes compression.
+    if "request_start" in g:
+        ir_system.monitor.record(
+            f"http_{request.endpoint or 'not_found'}",
+            time.perf_counter() - g.request_start,
+        )
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or response.mimetype != "application/json"
+        or "Content-Encoding" in response.headers
+        or response.content_length is None
+        or response.content_length < HTTP_COMPRESS_MIN_BYTES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    encoding = request.accept_encodings.best_match(encodings)
+
+    if encoding == "br":
+        response.set_data(
+            brotli.compress(response.get_data(), quality=HTTP_BROTLI_QUALITY)
+        )
+    elif encoding == "gzip":
+        response.set_data(
+            gzip.compress(response.get_data(), compresslevel=HTTP_GZIP_LEVEL, mtime=0)
+        )
+    else:
+        return response
+
+    response.headers["Content-Encoding"] = encoding
+    return response
 
 
 @app.route("/api/search", methods=["POST"])
@@ -21,102 +227,176 @@ def search():
         data = request.json
         query = data.get("query", "")
         top_k = data.get("top_k", 10)
+        filters = data.get("filters") or None
 
         if not query:
             return jsonify({"error": "Query is required"}), 400
 
+        if filters is not None and not isinstance(filters, dict):
+            return jsonify({"error": "Filters must be an object"}), 400
+
         if isinstance(top_k, str):
             top_k = int(top_k)
 
         top_k = min(max(1, top_k), 50)
+        fields, abstract_chars = parse_projection(data)
 
-        print(f"Searching for '{query}' with top_k={top_k}")
+        logger.debug("Searching for '%s' with top_k=%s", query, top_k)
 
-        results = ir_system.retrieve(query, top_k=top_k)
+        indices, scores = ir_system.rank_batch([query], top_k=top_k, filters=filters)[0]
+        facets = ir_system.facet_counts(filters)
 
-        serializable_results = []
-        for doc, score in results:
-            serializable_results.append(
-                {
-                    "document": doc,
-                    "score": float(score),
-                }
+        return json_response(
+            b'{"query":'
+            + dumps(query)
+            + b',"results":'
+            + serialize_results(indices, scores, fields, abstract_chars)
+            + b',"facets":'
+            + dumps(facets)
+            + b"}"
+        )
+    except EncodeQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error in search")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/search/batch", methods=["POST"])
+def search_batch():
+    try:
+        data = request.json
+        queries = data.get("queries", [])
+        top_k = data.get("top_k", 10)
+        filters = data.get("filters") or None
+
+        if not isinstance(queries, list) or not queries:
+            return jsonify({"error": "A non-empty list of queries is required"}), 400
+
+        if len(queries) > MAX_BATCH_QUERIES:
+            return (
+                jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch"}),
+                400,
             )
 
-        return jsonify({"query": query, "results": serializable_results})
+        if not all(isinstance(query, str) and query for query in queries):
+            return jsonify({"error": "Queries must be non-empty strings"}), 400
+
+        if filters is not None and not isinstance(filters, dict):
+            return jsonify({"error": "Filters must be an object"}), 400
+
+        if isinstance(top_k, str):
+            top_k = int(top_k)
+
+        top_k = min(max(1, top_k), 50)
+        fields, abstract_chars = parse_projection(data)
+
+        logger.debug("Batch search for %s queries with top_k=%s", len(queries), top_k)
+
+        batch_results = ir_system.rank_batch(queries, top_k=top_k, filters=filters)
+
+        serialized_batch = [
+            b'{"query":'
+            + dumps(query)
+            + b',"results":'
+            + serialize_results(indices, scores, fields, abstract_chars)
+            + b"}"
+            for query, (indices, scores) in zip(queries, batch_results)
+        ]
+
+        return json_response(b'{"results":[' + b",".join(serialized_batch) + b"]}")
+    except EncodeQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error in search: {str(e)}")
+        logger.exception("Error in batch search")
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/document/<path:doc_id>", methods=["GET"])
+@conditional
 def get_document(doc_id):
     try:
-        document = None
-        for doc in ir_system.documents:
-            if doc.get("id") == doc_id:
-                document = doc
-                break
+        fields, abstract_chars = parse_projection(request.args)
+        doc_index = ir_system.get_document_index(doc_id)
 
-        if document is None:
+        if doc_index == -1:
             return jsonify({"error": "Document not found"}), 404
 
-        return jsonify({"document": document})
+        with ir_system.monitor.span("serialization"):
+            fragment = ir_system.document_fragments(
+                [doc_index], fields, abstract_chars
+            )[0]
+            return json_response(b'{"document":' + fragment + b"}")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/similar/<path:doc_id>", methods=["GET"])
+@conditional
 def get_similar_documents(doc_id):
     try:
         top_k = request.args.get("top_k", default=5, type=int)
+        fields, abstract_chars = parse_projection(request.args)
 
-        doc_index = -1
-        for idx, doc in enumerate(ir_system.documents):
-            if doc.get("id") == doc_id:
-                doc_index = idx
-                break
+        doc_index = ir_system.get_document_index(doc_id)
 
         if doc_index == -1:
             return jsonify({"error": "Document not found"}), 404
 
-        results = ir_system.retrieve_similar_documents(doc_index, top_k=top_k)
+        indices, scores = ir_system.rank_similar_documents(doc_index, top_k=top_k)
 
-        serializable_results = []
-        for doc, score in results:
-            serializable_results.append(
-                {
-                    "document": doc,
-                    "score": float(score),
-                }
-            )
-
-        return jsonify({"document_id": doc_id, "results": serializable_results})
+        return json_response(
+            b'{"document_id":'
+            + dumps(doc_id)
+            + b',"results":'
+            + serialize_results(indices, scores, fields, abstract_chars)
+            + b"}"
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/documents", methods=["GET"])
+@conditional
 def get_documents():
     try:
         page = request.args.get("page", default=1, type=int)
         per_page = request.args.get("per_page", default=10, type=int)
+        fields, abstract_chars = parse_projection(request.args)
 
         start_idx = (page - 1) * per_page
         end_idx = start_idx + per_page
 
-        documents = ir_system.documents[start_idx:end_idx]
-        total = len(ir_system.documents)
+        doc_indices = ir_system.document_page_indices(start_idx, end_idx)
+        with ir_system.monitor.span("serialization"):
+            documents = ir_system.document_fragments(
+                doc_indices.tolist(), fields, abstract_chars
+            )
+        total = ir_system.document_count()
 
-        return jsonify(
-            {
-                "documents": documents,
-                "page": page,
-                "per_page": per_page,
-                "total": total,
-                "total_pages": (total + per_page - 1) // per_page,
-            }
+        return json_response(
+            b'{"documents":['
+            + b",".join(documents)
+            + b"],"
+            + dumps(
+                {
+                    "page": page,
+                    "per_page": per_page,
+                    "total": total,
+                    "total_pages": (total + per_page - 1) // per_page,
+                }
+            )[1:]
         )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -127,8 +407,9 @@ def get_stats():
         cache_stats = ir_system.get_cache_stats()
 
         stats = {
-            "total_documents": len(ir_system.documents),
+            "total_documents": ir_system.document_count(),
             "cache_stats": cache_stats,
+            "latency": ir_system.monitor.get_stats(),
         }
 
         return jsonify(stats)
@@ -136,5 +417,91 @@ def get_stats():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    version, _ = ir_system.collection_state()
+    lines = [
+        "# HELP irum_documents Live documents in the collection.",
+        "# TYPE irum_documents gauge",
+        f"irum_documents {ir_system.document_count()}",
+        "# HELP irum_collection_version Collection version, bumped on every change.",
+        "# TYPE irum_collection_version gauge",
+        f"irum_collection_version {version}",
+    ]
+    body = "\n".join(lines) + "\n" + ir_system.monitor.prometheus_text()
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+
+def admin_token_valid():
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(
+        request.headers.get("X-Admin-Token", "").encode(), ADMIN_TOKEN.encode()
+    )
+
+
+def check_admin_token():
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Admin API disabled (set IRUM_ADMIN_TOKEN)"}), 403
+
+    if not admin_token_valid():
+        return jsonify({"error": "Invalid admin token"}), 403
+
+    return None
+
+
+@app.route("/api/admin/traces", methods=["GET"])
+def admin_traces():
+    error = check_admin_token()
+    if error is not None:
+        return error
+
+    limit = request.args.get("limit", default=50, type=int)
+    return jsonify({"traces": ir_system.tracer.recent(limit)})
+
+
+@app.route("/api/admin/documents", methods=["POST", "PUT", "DELETE"])
+def admin_documents():
+    error = check_admin_token()
+    if error is not None:
+        return error
+
+    # Forked workers each own a copy of the collection, so a write would
+    # only reach the worker that served it.
+    if app.config.get("IRUM_WORKERS", 1) > 1:
+        return (
+            jsonify(
+                {
+                    "error": "Admin writes need a single worker (SERVE_WORKERS=1); "
+                    "with forked workers, edit the collection and restart"
+                }
+            ),
+            409,
+        )
+
+    try:
+        data = request.json or {}
+
+        if request.method == "POST":
+            changed = ir_system.add_documents(data.get("documents", []))
+        elif request.method == "PUT":
+            ir_system.update_document(data.get("document"))
+            changed = 1
+        else:
+            changed = ir_system.remove_documents(data.get("ids", []))
+
+        if data.get("persist"):
+            ir_system.save_collection(filepath=JSON_FILE)
+
+        return jsonify(
+            {"changed": changed, "total_documents": ir_system.document_count()}
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 if __name__ == "__main__":
+    # With the debug reloader only the serving child loads the system.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        load_system()
     app.run(debug=True)
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import random
+from typing import List
+from query_processor import QueryProcessor
+from utils import ensure_nltk_data, load_json
+from config import JSON_FILE
+from colorama import Fore, Style, init
+
+init(autoreset=True)
+
+DEFAULT_QUERIES = 5000
+DISTINCT_QUERIES = 500
+
+FALLBACK_QUERIES = [
+    "machine learning algorithms",
+    "redes neurais artificiais",
+    "processamento de linguagem natural",
+    "inteligência artificial",
+    "algoritmos de otimização para análise de dados",
+]
+
+
+def load_queries() -> List[str]:
+    # Document titles stand in for real queries when the collection exists.
+    if not os.path.exists(JSON_FILE):
+        return FALLBACK_QUERIES
+
+    titles = [doc.get("title") for doc in load_json(JSON_FILE)]
+    return [title for title in titles if title] or FALLBACK_QUERIES
+
+
+class LegacyQueryProcessor(QueryProcessor):
+    # Previous behaviour: stopword set rebuilt and word_tokenize on every call.
+    def extract_keywords(self, text: str, language: str = "portuguese") -> List[str]:
+        from nltk.corpus import stopwords
+        from nltk.tokenize import word_tokenize
+
+        stop_words = set(stopwords.words(language))
+        return [
+            token
+            for token in word_tokenize(text.lower())
+            if token.isalpha() and len(token) > 2 and token not in stop_words
+        ]
+
+
+def queries_per_second(processor: QueryProcessor, queries: List[str]) -> float:
+    processor.process_query(queries[0])
+
+    start = time.perf_counter()
+    for query in queries:
+        processor.process_query(query)
+    return len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    n_queries = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_QUERIES
+
+    ensure_nltk_data()
+    random.seed(42)
+    distinct = load_queries()[:DISTINCT_QUERIES]
+    unique_workload = [random.choice(distinct) + f" {i}" for i in range(n_queries)]
+    repeated_workload = [random.choice(distinct) for _ in range(n_queries)]
+
+    print(
+        f"{Fore.CYAN}Query processing benchmark ({n_queries} queries, "
+        f"{len(distinct)} distinct){Style.RESET_ALL}"
+    )
+    print("=" * 60)
+
+    configurations = [
+        ("legacy (word_tokenize)", LegacyQueryProcessor(cache_max_items=0)),
+        ("nltk tokenizer, cached stopwords", QueryProcessor("nltk", 0)),
+        ("regex tokenizer", QueryProcessor("regex", 0)),
+    ]
+
+    for label, processor in configurations:
+        qps = queries_per_second(processor, unique_workload)
+        print(f"{Fore.YELLOW}{label:<40}{Style.RESET_ALL} {qps:12,.0f} q/s")
+
+    processor = QueryProcessor("regex")
+    qps = queries_per_second(processor, repeated_workload)
+    print(
+        f"{Fore.GREEN}{'regex tokenizer + LRU (repeated)':<40} {qps:12,.0f} q/s "
+        f"(hit rate {processor.stats()['hit_rate']:.1%}){Style.RESET_ALL}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import sys
+import time
+from typing import List
+import numpy as np
+from boost_index import KEYWORD_MATCH_BOOST, MAX_BOOST_FACTOR
+from quantization import QuantizedMatrix
+from vector_index import normalize_rows, top_k_indices
+from colorama import Fore, Style, init
+
+init(autoreset=True)
+
+COLLECTION_SIZES = [10_000, 100_000, 1_000_000]
+EMBEDDING_DIM = 384
+N_QUERIES = 20
+TOP_K = 10
+RESCORE_CANDIDATES = 200
+CLUSTER_SIZE = 1000
+BOOSTED_FRACTION = 0.01
+BOOSTED_POOL = 0.05
+
+
+def legacy_search(embeddings: np.ndarray, query: np.ndarray, top_k: int) -> np.ndarray:
+    similarities = np.dot(embeddings, query) / (
+        np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query)
+    )
+    return np.argsort(similarities)[::-1][:top_k]
+
+
+def prepared_search(
+    prepared_embeddings: np.ndarray, query: np.ndarray, top_k: int
+) -> np.ndarray:
+    similarities = prepared_embeddings @ normalize_rows(query)
+    return top_k_indices(similarities, top_k)
+
+
+def time_per_query(search, embeddings: np.ndarray, queries: np.ndarray) -> float:
+    search(embeddings, queries[0], TOP_K)
+
+    start = time.perf_counter()
+    for query in queries:
+        search(embeddings, query, TOP_K)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def run_benchmark(n_documents: int) -> None:
+    rng = np.random.default_rng(2025)
+    embeddings = rng.standard_normal((n_documents, EMBEDDING_DIM), dtype=np.float32)
+    queries = rng.standard_normal((N_QUERIES, EMBEDDING_DIM), dtype=np.float32)
+
+    start = time.perf_counter()
+    prepared = normalize_rows(embeddings)
+    prepare_time = (time.perf_counter() - start) * 1000
+
+    legacy_ms = time_per_query(legacy_search, embeddings, queries)
+    prepared_ms = time_per_query(prepared_search, prepared, queries)
+
+    same = all(
+        np.array_equal(
+            legacy_search(embeddings, q, TOP_K), prepared_search(prepared, q, TOP_K)
+        )
+        for q in queries[:5]
+    )
+
+    print(
+        f"\n{Fore.YELLOW}{n_documents:,} documents x {EMBEDDING_DIM} dims{Style.RESET_ALL}"
+    )
+    print(f"  Prepare matrix (once):  {prepare_time:9.2f} ms")
+    print(f"  Legacy per query:       {legacy_ms:9.2f} ms")
+    print(f"  Prepared per query:     {prepared_ms:9.2f} ms")
+    print(f"  Speedup:                {legacy_ms / prepared_ms:9.2f}x")
+    print(f"  Same top-{TOP_K}:            {same}")
+
+
+def clustered_collection(n_documents: int, rng: np.random.Generator):
+    centers = rng.standard_normal((max(1, n_documents // CLUSTER_SIZE), EMBEDDING_DIM))
+    labels = rng.integers(0, len(centers), n_documents)
+    embeddings = centers[labels] + 0.5 * rng.standard_normal(
+        (n_documents, EMBEDDING_DIM)
+    )
+    query_sources = rng.choice(n_documents, N_QUERIES, replace=False)
+    queries = embeddings[query_sources] + 0.5 * rng.standard_normal(
+        (N_QUERIES, EMBEDDING_DIM)
+    )
+    return normalize_rows(embeddings), normalize_rows(queries)
+
+
+def recall_at_k(expected: List[np.ndarray], found: List[np.ndarray]) -> float:
+    return float(
+        np.mean([len(set(e) & set(f)) / len(e) for e, f in zip(expected, found)])
+    )
+
+
+def simulated_boosts(embeddings: np.ndarray, queries: np.ndarray, rng):
+    # Keyword/title matches are topical but loosely tied to embedding rank, so
+    # each query's boosted rows are drawn from its nearest BOOSTED_POOL slice.
+    n_documents = len(embeddings)
+    pool_size = max(1, int(n_documents * BOOSTED_POOL))
+    n_boosted = max(1, int(n_documents * BOOSTED_FRACTION))
+    boosts = []
+    for query in queries:
+        pool = top_k_indices(embeddings @ query, pool_size)
+        boosted = np.sort(rng.choice(pool, n_boosted, replace=False))
+        factors = rng.uniform(1 + KEYWORD_MATCH_BOOST, MAX_BOOST_FACTOR, n_boosted)
+        boosts.append((boosted, factors))
+    return boosts
+
+
+def boosted_ranking(indices, scores, boosted, factors) -> np.ndarray:
+    scores = scores.copy()
+    positions = np.searchsorted(boosted, indices)
+    matched = boosted[np.minimum(positions, len(boosted) - 1)] == indices
+    scores[matched] *= factors[positions[matched]]
+    return indices[top_k_indices(scores, TOP_K)]
+
+
+def run_quantization_report(n_documents: int) -> None:
+    rng = np.random.default_rng(2025)
+    embeddings, queries = clustered_collection(n_documents, rng)
+    boosts = simulated_boosts(embeddings, queries, rng)
+    all_indices = np.arange(n_documents)
+    exact = [top_k_indices(embeddings @ q, TOP_K) for q in queries]
+    exact_final = [
+        boosted_ranking(all_indices, embeddings @ q, boosted, factors)
+        for q, (boosted, factors) in zip(queries, boosts)
+    ]
+
+    print(
+        f"\n{Fore.YELLOW}Quantization recall@{TOP_K} - {n_documents:,} documents (rescoring top {RESCORE_CANDIDATES}){Style.RESET_ALL}"
+    )
+    print(
+        f"  {'precision':<10}{'memory MiB':>12}{'ms/query':>10}{'approx':>9}{'rescored':>10}{'boosted':>9}"
+    )
+    print(
+        f"  {'float32':<10}{embeddings.nbytes / 2**20:>12.1f}"
+        f"{time_per_query(prepared_search, embeddings, queries):>10.2f}{1.0:>9.3f}{1.0:>10.3f}{1.0:>9.3f}"
+    )
+
+    for precision in ("float16", "int8"):
+        quantized = QuantizedMatrix(precision)
+        quantized.build(embeddings)
+
+        approximate = [top_k_indices(row, TOP_K) for row in quantized.scores(queries)]
+
+        start = time.perf_counter()
+        candidates = [
+            quantized.search(query, embeddings, RESCORE_CANDIDATES, [boosted])[0]
+            for query, (boosted, _) in zip(queries, boosts)
+        ]
+        per_query = (time.perf_counter() - start) / len(queries) * 1000
+        # Recall of the final ranking: boost applied to the merged candidates.
+        final = [
+            boosted_ranking(idx, scores, boosted, factors)
+            for (idx, scores), (boosted, factors) in zip(candidates, boosts)
+        ]
+        rescored = [
+            idx[top_k_indices(scores, TOP_K)]
+            for idx, scores in quantized.search(queries, embeddings, RESCORE_CANDIDATES)
+        ]
+
+        print(
+            f"  {precision:<10}{quantized.nbytes / 2**20:>12.1f}{per_query:>10.2f}"
+            f"{recall_at_k(exact, approximate):>9.3f}{recall_at_k(exact, rescored):>10.3f}"
+            f"{recall_at_k(exact_final, final):>9.3f}"
+        )
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or COLLECTION_SIZES
+
+    print(f"{Fore.CYAN}Retrieval scoring micro-benchmark{Style.RESET_ALL}")
+    print("=" * 50)
+
+    for n_documents in sizes:
+        run_benchmark(n_documents)
+
+    for n_documents in sizes:
+        run_quantization_report(n_documents)
+
+
+if __name__ == "__main__":
+    main()
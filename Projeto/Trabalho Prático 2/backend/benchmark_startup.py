@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import subprocess
+import numpy as np
+from colorama import Fore, Style, init
+
+init(autoreset=True)
+
+DEFAULT_RUNS = 3
+
+PHASES = [
+    ("import_retrieval_system", "import retrieval_system"),
+    ("import_sentence_transformers", "import sentence_transformers"),
+    ("model_load", "InformationRetrievalSystem()"),
+    ("collection_load", "load_collection()"),
+    ("warmup", "warmup()"),
+    ("first_query", "first retrieve()"),
+    ("second_query", "second retrieve()"),
+]
+
+
+def measure_startup() -> dict:
+    # Runs in a fresh interpreter so every import is cold.
+    timings = {}
+
+    start = time.perf_counter()
+    import retrieval_system
+
+    timings["import_retrieval_system"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    import sentence_transformers
+
+    timings["import_sentence_transformers"] = time.perf_counter() - start
+
+    from config import JSON_FILE, MODEL_DIR
+
+    start = time.perf_counter()
+    ir_system = retrieval_system.InformationRetrievalSystem(model_path=MODEL_DIR)
+    timings["model_load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ir_system.load_collection(filepath=JSON_FILE)
+    timings["collection_load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ir_system.warmup()
+    timings["warmup"] = time.perf_counter() - start
+
+    for phase, query in (
+        ("first_query", "redes neurais artificiais"),
+        ("second_query", "algoritmos de otimização"),
+    ):
+        start = time.perf_counter()
+        ir_system.retrieve(query, top_k=10)
+        timings[phase] = time.perf_counter() - start
+
+    return timings
+
+
+def run_child() -> dict:
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    if "--child" in sys.argv:
+        print(json.dumps(measure_startup()))
+        return
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS
+
+    print(f"{Fore.CYAN}Startup benchmark ({runs} cold starts){Style.RESET_ALL}")
+    print("=" * 50)
+
+    results = [run_child() for _ in range(runs)]
+
+    total = 0.0
+    for phase, label in PHASES:
+        seconds = np.median([result[phase] for result in results])
+        if phase != "second_query":
+            total += seconds
+        print(f"{Fore.YELLOW}{label:<32}{Style.RESET_ALL} {seconds * 1000:9.1f} ms")
+
+    print(
+        f"{Fore.GREEN}{'time to first result':<32} {total * 1000:9.1f} ms{Style.RESET_ALL}"
+    )
+
+
+if __name__ == "__main__":
+    main()
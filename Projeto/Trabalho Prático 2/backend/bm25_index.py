@@ -0,0 +1,197 @@
+import logging
+import os
+import re
+import hashlib
+from collections import Counter
+from typing import List, Dict, Any, Tuple
+import numpy as np
+from config import BM25_K1, BM25_B
+from vector_index import append_rows, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[^\W\d_]{3,}")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def document_text(doc: Dict[str, Any]) -> str:
+    return " ".join(
+        [doc.get("title", ""), doc.get("abstract", "")] + doc.get("keywords", [])
+    )
+
+
+class BM25Index:
+    """Okapi BM25 over title, abstract and keywords with CSR postings.
+
+    Postings are three flat arrays (term offsets, document ids, term
+    frequencies). Documents added after the build go to small per-term side
+    lists, so incremental updates do not rewrite the main arrays. Removed
+    documents keep their postings (the caller masks them) but leave the
+    document frequencies, the live document count and the average length.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary = {}
+        self.term_offsets = None
+        self.posting_docs = None
+        self.posting_tfs = None
+        self.document_frequencies = None
+        self.doc_lengths = None
+        self.n_docs = 0
+        self.n_removed = 0
+        self.total_length = 0.0
+        self.extra_postings = {}
+        self.fingerprint = None
+
+    def fingerprint_documents(self, documents: List[Dict[str, Any]]) -> str:
+        digest = hashlib.md5()
+        for doc in documents:
+            digest.update(document_text(doc).encode())
+            digest.update(b"\0")
+        return f"{len(documents)}:{self.k1}:{self.b}:{digest.hexdigest()}"
+
+    def build(self, documents: List[Dict[str, Any]]) -> None:
+        logger.info("Building BM25 index over %s documents...", len(documents))
+
+        term_ids, doc_ids, tfs = [], [], []
+        doc_lengths = np.zeros(len(documents), dtype=np.float32)
+
+        for doc_index, doc in enumerate(documents):
+            tokens = tokenize(document_text(doc))
+            doc_lengths[doc_index] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                doc_ids.append(doc_index)
+                tfs.append(tf)
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        counts = np.bincount(term_ids, minlength=len(self.vocabulary))
+
+        self.term_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.posting_docs = np.array(doc_ids, dtype=np.int32)[order]
+        self.posting_tfs = np.array(tfs, dtype=np.float32)[order]
+        self.document_frequencies = counts.astype(np.int64)
+        self.doc_lengths = doc_lengths
+        self.n_docs = len(documents)
+        self.total_length = float(doc_lengths.sum())
+        self.n_removed = 0
+        self.extra_postings = {}
+        self.fingerprint = self.fingerprint_documents(documents)
+
+    def add_documents(self, documents: List[Dict[str, Any]], start_index: int) -> None:
+        new_lengths = np.zeros(len(documents), dtype=np.float32)
+        new_frequencies = Counter()
+
+        for offset, doc in enumerate(documents):
+            tokens = tokenize(document_text(doc))
+            new_lengths[offset] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_id = self.vocabulary.setdefault(term, len(self.vocabulary))
+                self.extra_postings.setdefault(term_id, []).append(
+                    (start_index + offset, tf)
+                )
+                new_frequencies[term_id] += 1
+
+        document_frequencies = np.zeros(len(self.vocabulary), dtype=np.int64)
+        document_frequencies[: len(self.document_frequencies)] = (
+            self.document_frequencies
+        )
+        for term_id, count in new_frequencies.items():
+            document_frequencies[term_id] += count
+        self.document_frequencies = document_frequencies
+
+        self.doc_lengths = append_rows(self.doc_lengths, start_index, new_lengths)
+        self.n_docs = start_index + len(documents)
+        self.total_length += float(new_lengths.sum())
+
+    def remove_documents(self, documents: List[Dict[str, Any]]) -> None:
+        for doc in documents:
+            tokens = tokenize(document_text(doc))
+            for term in set(tokens):
+                self.document_frequencies[self.vocabulary[term]] -= 1
+            self.total_length -= len(tokens)
+        self.n_removed += len(documents)
+
+    def _term_postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        if term_id < len(self.term_offsets) - 1:
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs, tfs = self.posting_docs[start:end], self.posting_tfs[start:end]
+        else:
+            docs = np.empty(0, dtype=np.int32)
+            tfs = np.empty(0, dtype=np.float32)
+
+        extra = self.extra_postings.get(term_id)
+        if extra:
+            extra_docs, extra_tfs = zip(*extra)
+            docs = np.concatenate((docs, np.array(extra_docs, dtype=np.int32)))
+            tfs = np.concatenate((tfs, np.array(extra_tfs, dtype=np.float32)))
+
+        return docs, tfs
+
+    def search(self, query_terms: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        term_ids = {
+            self.vocabulary[term] for term in query_terms if term in self.vocabulary
+        }
+        n_live = self.n_docs - self.n_removed
+        if not term_ids or not n_live:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        doc_lengths = self.doc_lengths[: self.n_docs]
+        average_length = self.total_length / n_live
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+
+        for term_id in term_ids:
+            docs, tfs = self._term_postings(term_id)
+            df = self.document_frequencies[term_id]
+            idf = np.log(1.0 + (n_live - df + 0.5) / (df + 0.5))
+            length_norm = 1.0 - self.b + self.b * doc_lengths[docs] / average_length
+            scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + self.k1 * length_norm)
+
+        matched = np.flatnonzero(scores)
+        best = top_k_indices(scores[matched], k)
+        return matched[best], scores[matched[best]]
+
+    def save(self, filepath: str) -> None:
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez(
+            filepath,
+            terms=np.array(terms, dtype=str),
+            term_offsets=self.term_offsets,
+            posting_docs=self.posting_docs,
+            posting_tfs=self.posting_tfs,
+            doc_lengths=self.doc_lengths[: self.n_docs],
+            fingerprint=np.array(self.fingerprint),
+        )
+
+    def load(self, filepath: str, documents: List[Dict[str, Any]]) -> bool:
+        if not os.path.exists(filepath):
+            return False
+
+        try:
+            data = np.load(filepath)
+            fingerprint = str(data["fingerprint"])
+        except Exception:
+            return False
+
+        if fingerprint != self.fingerprint_documents(documents):
+            return False
+
+        self.vocabulary = {term: i for i, term in enumerate(data["terms"].tolist())}
+        self.term_offsets = data["term_offsets"]
+        self.posting_docs = data["posting_docs"]
+        self.posting_tfs = data["posting_tfs"]
+        self.document_frequencies = np.diff(self.term_offsets)
+        self.doc_lengths = data["doc_lengths"]
+        self.n_docs = len(self.doc_lengths)
+        self.total_length = float(self.doc_lengths.sum())
+        self.n_removed = 0
+        self.extra_postings = {}
+        self.fingerprint = fingerprint
+        return True
@@ -0,0 +1,163 @@
+import re
+from itertools import groupby
+from collections import defaultdict
+from typing import List, Dict, Any
+import numpy as np
+
+KEYWORD_MATCH_BOOST = 0.1
+TITLE_MATCH_BOOST = 0.15
+MAX_BOOST_FACTOR = 1.5
+
+EMPTY_POSTINGS = np.empty(0, dtype=np.int64)
+
+
+class BoostIndex:
+    """Inverted indexes behind the keyword/title boost applied in retrieve().
+
+    Keywords are matched exactly against the normalized keyword strings.
+    Titles are matched as substrings, as before: an alphabetic query token
+    can only occur inside a run of alphabetic title characters, so titles are
+    indexed by those runs and a token is resolved against the run vocabulary.
+    """
+
+    def __init__(self, max_memoized_tokens: int = 10000):
+        self.keyword_postings = {}
+        self.title_term_postings = []
+        self.title_term_ids = {}
+        self.title_vocabulary = ""
+        self.title_term_starts = None
+        self.max_memoized_tokens = max_memoized_tokens
+        self._title_token_postings = {}
+
+    def build(self, documents: List[Dict[str, Any]]) -> None:
+        keyword_docs = defaultdict(list)
+        title_docs = defaultdict(list)
+
+        for doc_index, doc in enumerate(documents):
+            for keyword in {kw.lower().strip() for kw in doc.get("keywords", [])}:
+                keyword_docs[keyword].append(doc_index)
+
+            for term in self._title_terms(doc.get("title", "")):
+                title_docs[term].append(doc_index)
+
+        self.keyword_postings = {
+            keyword: np.array(docs, dtype=np.int64)
+            for keyword, docs in keyword_docs.items()
+        }
+
+        terms = list(title_docs)
+        self.title_term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        self.title_term_postings = [
+            np.array(title_docs[term], dtype=np.int64) for term in terms
+        ]
+        self.title_vocabulary = "\n".join(terms)
+        self.title_term_starts = np.cumsum(
+            [0] + [len(term) + 1 for term in terms[:-1]], dtype=np.int64
+        )
+        self._title_token_postings = {}
+
+    def add_documents(self, documents: List[Dict[str, Any]], start_index: int) -> None:
+        keyword_docs = defaultdict(list)
+        title_docs = defaultdict(list)
+
+        for doc_index, doc in enumerate(documents, start_index):
+            for keyword in {kw.lower().strip() for kw in doc.get("keywords", [])}:
+                keyword_docs[keyword].append(doc_index)
+
+            for term in self._title_terms(doc.get("title", "")):
+                title_docs[term].append(doc_index)
+
+        for keyword, docs in keyword_docs.items():
+            self.keyword_postings[keyword] = np.concatenate(
+                (self.keyword_postings.get(keyword, EMPTY_POSTINGS), docs)
+            ).astype(np.int64)
+
+        new_terms = []
+        for term, docs in title_docs.items():
+            if term in self.title_term_ids:
+                term_id = self.title_term_ids[term]
+                self.title_term_postings[term_id] = np.concatenate(
+                    (self.title_term_postings[term_id], docs)
+                ).astype(np.int64)
+            else:
+                self.title_term_ids[term] = len(self.title_term_postings)
+                self.title_term_postings.append(np.array(docs, dtype=np.int64))
+                new_terms.append(term)
+
+        if new_terms:
+            offset = len(self.title_vocabulary) + 1 if self.title_vocabulary else 0
+            new_starts = offset + np.cumsum(
+                [0] + [len(term) + 1 for term in new_terms[:-1]], dtype=np.int64
+            )
+            if self.title_vocabulary:
+                self.title_term_starts = np.concatenate(
+                    (self.title_term_starts, new_starts)
+                )
+                self.title_vocabulary += "\n" + "\n".join(new_terms)
+            else:
+                self.title_term_starts = new_starts
+                self.title_vocabulary = "\n".join(new_terms)
+
+        self._title_token_postings = {}
+
+    def _title_terms(self, title: str) -> set:
+        return {
+            "".join(chars)
+            for is_alpha, chars in groupby(title.lower(), str.isalpha)
+            if is_alpha
+        }
+
+    def title_postings(self, token: str) -> np.ndarray:
+        # Readers share the memo and one of them may clear it, so look up once.
+        postings = self._title_token_postings.get(token)
+        if postings is not None:
+            return postings
+
+        offsets = []
+        if token:
+            offsets = [
+                match.start()
+                for match in re.finditer(re.escape(token), self.title_vocabulary)
+            ]
+
+        if not offsets:
+            postings = EMPTY_POSTINGS
+        else:
+            term_ids = np.unique(
+                np.searchsorted(self.title_term_starts, offsets, side="right") - 1
+            )
+            postings = np.unique(
+                np.concatenate([self.title_term_postings[t] for t in term_ids])
+            )
+
+        if len(self._title_token_postings) >= self.max_memoized_tokens:
+            self._title_token_postings.clear()
+        self._title_token_postings[token] = postings
+
+        return postings
+
+    def boost_factors(self, query_keywords: List[str]):
+        keyword_hits = [
+            self.keyword_postings.get(t, EMPTY_POSTINGS) for t in query_keywords
+        ]
+        title_hits = [self.title_postings(t) for t in query_keywords]
+
+        matched_docs = np.unique(np.concatenate(keyword_hits + title_hits))
+        if not matched_docs.size:
+            return matched_docs, np.empty(0)
+
+        keyword_matches = np.zeros(len(matched_docs))
+        for hits in keyword_hits:
+            keyword_matches[np.searchsorted(matched_docs, hits)] += 1
+
+        title_matches = np.zeros(len(matched_docs))
+        for hits in title_hits:
+            title_matches[np.searchsorted(matched_docs, hits)] += 1
+
+        factors = (
+            1.0
+            + KEYWORD_MATCH_BOOST * keyword_matches
+            + TITLE_MATCH_BOOST * title_matches
+        )
+
+        return matched_docs, np.minimum(factors, MAX_BOOST_FACTOR)
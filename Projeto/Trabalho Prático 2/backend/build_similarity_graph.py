@@ -0,0 +1,34 @@
+import sys
+import time
+from config import JSON_FILE, MODEL_DIR, SIMILARITY_GRAPH_K, SIMILARITY_GRAPH_WORKERS
+from retrieval_system import InformationRetrievalSystem
+from utils import configure_logging
+from colorama import Fore, Style, init
+
+init(autoreset=True)
+
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else SIMILARITY_GRAPH_K
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else SIMILARITY_GRAPH_WORKERS
+
+    configure_logging()
+
+    print(f"{Fore.CYAN}Similar-documents graph{Style.RESET_ALL}")
+    print("=" * 50)
+
+    ir_system = InformationRetrievalSystem(model_path=MODEL_DIR)
+    ir_system.load_collection(filepath=JSON_FILE)
+
+    start = time.perf_counter()
+    graph = ir_system.build_similarity_graph(k, n_workers)
+    elapsed = time.perf_counter() - start
+
+    size_mb = (graph.neighbours.nbytes + graph.scores.nbytes) / 2**20
+    print(
+        f"{Fore.GREEN}{graph.n_rows} documents x {graph.k} neighbours in {elapsed:.1f}s ({size_mb:.1f} MiB){Style.RESET_ALL}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,134 +1,530 @@
+import logging
 import pickle
 import hashlib
 import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 from typing import Dict, List, Any
 import numpy as np
-from colorama import Fore, Style, init
+from tracing import record_stage
+from config import (
+    CACHE_DIR,
+    CACHE_BACKEND,
+    MEMORY_CACHE_MAX_ITEMS,
+    MEMORY_CACHE_MAX_BYTES,
+    QUERY_RESULT_CACHE_MAX_ITEMS,
+    QUERY_RESULT_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class LRUMemoryCache:
+    def __init__(self, max_items: int, max_bytes: int):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> np.ndarray:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: np.ndarray) -> None:
+        size = value.nbytes
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous.nbytes
+
+            self._entries[key] = value
+            self.current_bytes += size
+
+            while (
+                len(self._entries) > self.max_items
+                or self.current_bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_items": self.max_items,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class PickleCacheBackend:
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.location = cache_dir
+        self._count = len([f for f in os.listdir(cache_dir) if f.endswith(".pkl")])
+        self._count_lock = threading.Lock()
 
-init(autoreset=True)
+    def _get_cache_path(self, cache_key: str) -> str:
+        return os.path.join(self.cache_dir, f"{cache_key}.pkl")
+
+    def get(self, cache_key: str) -> np.ndarray:
+        cache_path = self._get_cache_path(cache_key)
+        if not os.path.exists(cache_path):
+            return None
+
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+        except:
+            try:
+                os.remove(cache_path)
+            except FileNotFoundError:
+                return None
+            with self._count_lock:
+                self._count -= 1
+            return None
+
+    def get_many(self, cache_keys: List[str]) -> Dict[str, np.ndarray]:
+        embeddings = {}
+        for cache_key in cache_keys:
+            embedding = self.get(cache_key)
+            if embedding is not None:
+                embeddings[cache_key] = embedding
+        return embeddings
+
+    def put_many(self, key_embedding_pairs: List[tuple]) -> None:
+        for cache_key, embedding in key_embedding_pairs:
+            cache_path = self._get_cache_path(cache_key)
+            tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            is_new = not os.path.exists(cache_path)
+            try:
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(embedding, f)
+                os.replace(tmp_path, cache_path)
+                with self._count_lock:
+                    self._count += is_new
+            except Exception as e:
+                logger.warning("Could not cache embedding: %s", e)
+
+    def clear(self) -> None:
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(".pkl"):
+                os.remove(os.path.join(self.cache_dir, filename))
+        self._count = 0
+
+    def count(self) -> int:
+        return self._count
+
+
+class SQLiteCacheBackend:
+    """All embeddings in one SQLite file, stored as float32 BLOBs keyed by cache key.
+
+    WAL journaling lets any number of readers (threads or worker processes)
+    proceed while a single writer commits; each thread gets its own connection.
+    """
+
+    def __init__(self, cache_dir: str, max_query_params: int = 500):
+        self.location = os.path.join(cache_dir, "embeddings.sqlite3")
+        self.max_query_params = max_query_params
+        self._local = threading.local()
+        self._count_lock = threading.Lock()
+
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, embedding BLOB NOT NULL) WITHOUT ROWID"
+        )
+        connection.commit()
+        self._count = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[
+            0
+        ]
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        # SQLite connections must not cross fork, so forked workers reconnect.
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.location, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, cache_key: str) -> np.ndarray:
+        return self.get_many([cache_key]).get(cache_key)
+
+    def get_many(self, cache_keys: List[str]) -> Dict[str, np.ndarray]:
+        connection = self._connection()
+        embeddings = {}
+
+        for start in range(0, len(cache_keys), self.max_query_params):
+            chunk = cache_keys[start : start + self.max_query_params]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT key, embedding FROM embeddings WHERE key IN ({placeholders})",
+                chunk,
+            )
+            for cache_key, blob in rows:
+                embeddings[cache_key] = np.frombuffer(blob, dtype=np.float32)
+
+        return embeddings
+
+    def put_many(self, key_embedding_pairs: List[tuple]) -> None:
+        connection = self._connection()
+        try:
+            with connection:
+                cursor = connection.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, embedding) VALUES (?, ?)",
+                    (
+                        (cache_key, np.asarray(embedding, dtype=np.float32).tobytes())
+                        for cache_key, embedding in key_embedding_pairs
+                    ),
+                )
+            with self._count_lock:
+                self._count += max(cursor.rowcount, 0)
+        except sqlite3.Error as e:
+            logger.warning("Could not cache embeddings: %s", e)
+
+    def clear(self) -> None:
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM embeddings")
+        with self._count_lock:
+            self._count = 0
+
+    def count(self) -> int:
+        return self._count
+
+
+CACHE_BACKENDS = {"pickle": PickleCacheBackend, "sqlite": SQLiteCacheBackend}
 
 
 class EmbeddingCache:
-    def __init__(self, cache_dir: str = "cache"):
+    def __init__(self, cache_dir: str = CACHE_DIR, backend: str = CACHE_BACKEND):
+        if backend not in CACHE_BACKENDS:
+            raise ValueError(
+                f"Unknown cache backend '{backend}' (available: {', '.join(CACHE_BACKENDS)})"
+            )
+
         self.cache_dir = cache_dir
         os.makedirs(cache_dir, exist_ok=True)
-        self.memory_cache = {}
-        self.max_memory_items = 1000
+        self.backend = CACHE_BACKENDS[backend](cache_dir)
+        self.memory_cache = LRUMemoryCache(
+            MEMORY_CACHE_MAX_ITEMS, MEMORY_CACHE_MAX_BYTES
+        )
 
     def _get_cache_key(self, text: str, model_name: str) -> str:
         content = f"{model_name}:{text}"
         return hashlib.md5(content.encode()).hexdigest()
 
-    def _get_cache_path(self, cache_key: str) -> str:
-        return os.path.join(self.cache_dir, f"{cache_key}.pkl")
-
     def get_embedding(self, text: str, model_name: str) -> np.ndarray:
         cache_key = self._get_cache_key(text, model_name)
 
-        if cache_key in self.memory_cache:
-            return self.memory_cache[cache_key]
-
-        cache_path = self._get_cache_path(cache_key)
-        if os.path.exists(cache_path):
-            try:
-                with open(cache_path, "rb") as f:
-                    embedding = pickle.load(f)
-
-                if len(self.memory_cache) < self.max_memory_items:
-                    self.memory_cache[cache_key] = embedding
+        embedding = self.memory_cache.get(cache_key)
+        if embedding is not None:
+            return embedding
 
-                return embedding
-            except:
-                os.remove(cache_path)
+        embedding = self.backend.get(cache_key)
+        if embedding is not None:
+            self.memory_cache.put(cache_key, embedding)
 
-        return None
+        return embedding
 
     def store_embedding(self, text: str, model_name: str, embedding: np.ndarray):
-        cache_key = self._get_cache_key(text, model_name)
-
-        if len(self.memory_cache) < self.max_memory_items:
-            self.memory_cache[cache_key] = embedding
-
-        cache_path = self._get_cache_path(cache_key)
-        try:
-            with open(cache_path, "wb") as f:
-                pickle.dump(embedding, f)
-        except Exception as e:
-            print(
-                f"{Fore.YELLOW}Warning: Could not cache embedding: {e}{Style.RESET_ALL}"
-            )
+        self.batch_store_embeddings([(text, embedding)], model_name)
 
     def batch_get_embeddings(
-        self, texts: List[str], model_name: str
+        self, texts: List[str], model_name: str, remember: bool = True
     ) -> Dict[str, np.ndarray]:
         cached_embeddings = {}
+        missing_keys = {}
 
         for text in texts:
-            embedding = self.get_embedding(text, model_name)
+            cache_key = self._get_cache_key(text, model_name)
+            embedding = self.memory_cache.get(cache_key) if remember else None
             if embedding is not None:
                 cached_embeddings[text] = embedding
+            else:
+                missing_keys[cache_key] = text
+
+        if missing_keys:
+            for cache_key, embedding in self.backend.get_many(
+                list(missing_keys)
+            ).items():
+                if remember:
+                    self.memory_cache.put(cache_key, embedding)
+                cached_embeddings[missing_keys[cache_key]] = embedding
 
         return cached_embeddings
 
     def batch_store_embeddings(
-        self, text_embedding_pairs: List[tuple], model_name: str
+        self, text_embedding_pairs: List[tuple], model_name: str, remember: bool = True
     ):
+        key_embedding_pairs = []
         for text, embedding in text_embedding_pairs:
-            self.store_embedding(text, model_name, embedding)
+            cache_key = self._get_cache_key(text, model_name)
+            if remember:
+                self.memory_cache.put(cache_key, embedding)
+            key_embedding_pairs.append((cache_key, embedding))
+
+        self.backend.put_many(key_embedding_pairs)
 
     def clear_cache(self):
         self.memory_cache.clear()
-
-        for filename in os.listdir(self.cache_dir):
-            if filename.endswith(".pkl"):
-                os.remove(os.path.join(self.cache_dir, filename))
+        self.backend.clear()
 
     def get_cache_stats(self) -> Dict[str, Any]:
-        disk_files = len([f for f in os.listdir(self.cache_dir) if f.endswith(".pkl")])
-        memory_items = len(self.memory_cache)
-
         return {
-            "memory_cached_items": memory_items,
-            "disk_cached_items": disk_files,
+            "memory_cached_items": len(self.memory_cache),
+            "disk_cached_items": self.backend.count(),
             "cache_directory": self.cache_dir,
+            "cache_backend": type(self.backend).__name__,
+            "memory_cache": self.memory_cache.stats(),
         }
 
 
-class PerformanceMonitor:
+class QueryResultCache:
+    """LRU + TTL cache of ranked (document index, score) arrays per query.
+
+    Keys carry the collection version, and the owner clears the cache on every
+    version bump, so entries never outlive the collection they were ranked on.
+    """
+
+    def __init__(
+        self,
+        max_items: int = QUERY_RESULT_CACHE_MAX_ITEMS,
+        ttl: float = QUERY_RESULT_CACHE_TTL,
+    ):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, indices, scores = entry
+            if self.ttl and time.monotonic() > expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return indices, scores
+
+    def put(self, key: tuple, indices: np.ndarray, scores: np.ndarray) -> None:
+        if self.max_items <= 0:
+            return
+
+        indices.flags.writeable = False
+        scores.flags.writeable = False
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, indices, scores)
+
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._entries),
+            "max_items": self.max_items,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of durations in microseconds.
+
+    Values below 32 us get their own bucket; above that every power of two is
+    split into 16 linear sub-buckets, so any percentile is reported within
+    6.25% of the true value while the bucket list stays a few hundred long.
+    """
+
+    SUB_BUCKETS = 16
+
     def __init__(self):
-        self.timings = {}
-        self.counters = {}
+        self.buckets = []
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _bucket(self, micros: int) -> int:
+        if micros < 2 * self.SUB_BUCKETS:
+            return micros
+        shift = micros.bit_length() - 5
+        return (
+            2 * self.SUB_BUCKETS
+            + (shift - 1) * self.SUB_BUCKETS
+            + ((micros >> shift) - self.SUB_BUCKETS)
+        )
+
+    def _upper_bound(self, bucket: int) -> int:
+        if bucket < 2 * self.SUB_BUCKETS:
+            return bucket
+        shift, sub_bucket = divmod(bucket - 2 * self.SUB_BUCKETS, self.SUB_BUCKETS)
+        return ((sub_bucket + self.SUB_BUCKETS + 1) << (shift + 1)) - 1
+
+    def record(self, seconds: float) -> None:
+        bucket = self._bucket(int(seconds * 1e6))
+        if bucket >= len(self.buckets):
+            self.buckets.extend([0] * (bucket + 1 - len(self.buckets)))
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        if not self.count:
+            return 0.0
+
+        rank = max(1, int(np.ceil(percent / 100 * self.count)))
+        seen = 0
+        for bucket, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self._upper_bound(bucket) / 1e6, self.max)
+        return self.max
 
-    def start_timer(self, operation: str):
-        import time
 
-        self.timings[operation] = time.time()
+class PerformanceMonitor:
+    """Thread-safe per-operation latency histograms on a monotonic clock.
 
-    def end_timer(self, operation: str):
-        import time
+    start_timer/end_timer keep their start times per thread, so concurrent
+    requests timing the same operation no longer overwrite each other.
+    """
+
+    QUANTILES = (50, 95, 99)
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def record(self, operation: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = LatencyHistogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def span(self, operation: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.record(operation, duration)
+            record_stage(operation, duration)
 
-        if operation in self.timings:
-            duration = time.time() - self.timings[operation]
-            if f"{operation}_total" not in self.counters:
-                self.counters[f"{operation}_total"] = 0
-                self.counters[f"{operation}_count"] = 0
+    def start_timer(self, operation: str):
+        timers = getattr(self._local, "timers", None)
+        if timers is None:
+            timers = self._local.timers = {}
+        timers.setdefault(operation, []).append(time.perf_counter())
 
-            self.counters[f"{operation}_total"] += duration
-            self.counters[f"{operation}_count"] += 1
+    def end_timer(self, operation: str):
+        timers = getattr(self._local, "timers", {})
+        if not timers.get(operation):
+            return 0
 
-            return duration
-        return 0
+        duration = time.perf_counter() - timers[operation].pop()
+        self.record(operation, duration)
+        return duration
 
     def get_stats(self) -> Dict[str, float]:
         stats = {}
-        for key, value in self.counters.items():
-            if key.endswith("_total"):
-                operation = key[:-6]
-                count_key = f"{operation}_count"
-                if count_key in self.counters:
-                    avg_time = value / self.counters[count_key]
-                    stats[f"{operation}_avg_time"] = avg_time
-                    stats[f"{operation}_total_time"] = value
-                    stats[f"{operation}_count"] = self.counters[count_key]
+        with self._lock:
+            for operation, histogram in self.histograms.items():
+                stats[f"{operation}_avg_time"] = histogram.total / histogram.count
+                stats[f"{operation}_total_time"] = histogram.total
+                stats[f"{operation}_count"] = histogram.count
+                for quantile in self.QUANTILES:
+                    stats[f"{operation}_p{quantile}"] = histogram.percentile(quantile)
+                stats[f"{operation}_max"] = histogram.max
 
         return stats
+
+    def prometheus_text(self, prefix: str = "irum") -> str:
+        name = f"{prefix}_operation_duration_seconds"
+        lines = [
+            f"# HELP {name} Duration of timed operations.",
+            f"# TYPE {name} summary",
+        ]
+        with self._lock:
+            for operation, histogram in sorted(self.histograms.items()):
+                label = operation.replace("\\", "\\\\").replace('"', '\\"')
+                for quantile in self.QUANTILES:
+                    lines.append(
+                        f'{name}{{operation="{label}",quantile="{quantile / 100}"}} {histogram.percentile(quantile):.6f}'
+                    )
+                lines.append(f'{name}_sum{{operation="{label}"}} {histogram.total:.6f}')
+                lines.append(f'{name}_count{{operation="{label}"}} {histogram.count}')
+
+        return "\n".join(lines) + "\n"
+
+
+def timed(operation: str):
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.monitor.span(operation):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,279 @@
+import os
+import queue
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from functools import wraps
+from concurrent.futures import Future
+from typing import List, Dict, Any, Tuple
+import numpy as np
+from config import (
+    ENCODE_BATCH_MAX_SIZE,
+    ENCODE_BATCH_MAX_WAIT_MS,
+    ENCODE_MAX_PENDING,
+    ENCODE_QUEUE_TIMEOUT,
+)
+
+
+class EncodeQueueFull(RuntimeError):
+    pass
+
+
+_batchers = weakref.WeakSet()
+
+
+def _reset_batchers_after_fork() -> None:
+    for batcher in list(_batchers):
+        batcher._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_batchers_after_fork)
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer; writers are preferred.
+
+    Both sides are reentrant: a reader may nest reads and the writing thread
+    may re-enter write() and read(), so locked methods can call each other
+    (update -> add -> remove) without deadlocking.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writers_waiting = 0
+        self._writer = None
+        self._write_depth = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        depth = getattr(self._local, "read_depth", 0)
+        if depth or self._writer == threading.get_ident():
+            self._local.read_depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.read_depth = depth
+            return
+
+        with self._condition:
+            while self._writer is not None or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        self._local.read_depth = 1
+        try:
+            yield
+        finally:
+            self._local.read_depth = 0
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer != me:
+                self._writers_waiting += 1
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+                self._writers_waiting -= 1
+                self._writer = me
+            self._write_depth += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._write_depth -= 1
+                if not self._write_depth:
+                    self._writer = None
+                    self._condition.notify_all()
+
+
+def read_locked(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def write_locked(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.write():
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class EncodeBatcher:
+    """Coalesces concurrent query encodes into one model.encode call.
+
+    A single worker thread takes the first pending request, keeps collecting
+    for up to `max_wait_ms` or until `max_batch_size` texts are queued, encodes
+    the unique texts together and hands each caller its rows. It only waits
+    while other callers are in flight, so a lone query is encoded at once. The queue holds
+    at most `max_pending` requests; callers that cannot enqueue within
+    `queue_timeout` seconds get EncodeQueueFull, which the API turns into a 503.
+
+    The worker starts on the first encode and is reset in forked children
+    (threads do not survive fork), so a preloaded master can fork workers.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_size: int = ENCODE_BATCH_MAX_SIZE,
+        max_wait_ms: float = ENCODE_BATCH_MAX_WAIT_MS,
+        max_pending: int = ENCODE_MAX_PENDING,
+        queue_timeout: float = ENCODE_QUEUE_TIMEOUT,
+    ):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._reset()
+        _batchers.add(self)
+
+    def _reset(self) -> None:
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._worker = None
+        self._in_flight = 0
+        self.batches = 0
+        self.requests = 0
+        self.encoded_texts = 0
+        self.largest_batch = 0
+        self.batch_size_histogram = {}
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                worker = threading.Thread(
+                    target=self._run, name="encode-batcher", daemon=True
+                )
+                worker.start()
+                self._worker = worker
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        self._ensure_worker()
+        future = Future()
+        with self._stats_lock:
+            self._in_flight += 1
+        try:
+            try:
+                self._queue.put((list(texts), future), timeout=self.queue_timeout)
+            except queue.Full:
+                raise EncodeQueueFull("Too many pending query encodes, try again later")
+            return future.result()
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+
+    def _collect(self) -> Tuple[list, bool]:
+        first = self._queue.get()
+        if first is None:
+            return [], True
+
+        pending = [first]
+        n_texts = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+
+        while n_texts < self.max_batch_size:
+            if self._queue.empty() and self._in_flight <= len(pending):
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return pending, True
+            pending.append(item)
+            n_texts += len(item[0])
+
+        return pending, False
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            pending, stopping = self._collect()
+            if pending:
+                self._encode_batch(pending)
+
+    def _encode_batch(self, pending: list) -> None:
+        unique_texts = list(
+            dict.fromkeys(text for texts, _ in pending for text in texts)
+        )
+
+        try:
+            # max_batch_size only bounds how many requests are coalesced; a
+            # single request can carry many more texts, so model.encode splits
+            # them into forward passes of at most max_batch_size sequences.
+            embeddings = self.model.encode(
+                unique_texts,
+                batch_size=self.max_batch_size,
+                convert_to_numpy=True,
+            )
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        rows = {text: row for row, text in enumerate(unique_texts)}
+        for texts, future in pending:
+            future.set_result(embeddings[[rows[text] for text in texts]])
+
+        self._record_batch(len(pending), len(unique_texts))
+
+    def _record_batch(self, n_requests: int, n_texts: int) -> None:
+        bucket = 1 << max(n_texts - 1, 0).bit_length()
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += n_requests
+            self.encoded_texts += n_texts
+            self.largest_batch = max(self.largest_batch, n_texts)
+            self.batch_size_histogram[bucket] = (
+                self.batch_size_histogram.get(bucket, 0) + 1
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "encoded_texts": self.encoded_texts,
+                "mean_batch_size": (
+                    self.encoded_texts / self.batches if self.batches else 0.0
+                ),
+                "mean_requests_per_batch": (
+                    self.requests / self.batches if self.batches else 0.0
+                ),
+                "largest_batch": self.largest_batch,
+                "batch_size_histogram": {
+                    f"<={bucket}": count
+                    for bucket, count in sorted(self.batch_size_histogram.items())
+                },
+                "queued_requests": self._queue.qsize(),
+            }
+
+    def shutdown(self) -> None:
+        _batchers.discard(self)
+        with self._start_lock:
+            if self._worker is None:
+                return
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
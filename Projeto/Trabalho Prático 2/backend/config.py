@@ -12,6 +12,12 @@ JSON_FILE = f"{DATA_DIR}/collection_documents.json"
 TRAIN_FILE = f"{DATA_DIR}/training_similarities.json"
 MODEL_DIR = "models"
 
+CACHE_DIR = "cache"
+CACHE_BACKEND = "sqlite"
+MEMORY_CACHE_MAX_ITEMS = 10000
+MEMORY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+EMBEDDING_STORE_DIR = f"{CACHE_DIR}/matrices"
+
 BASE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 SIMILARITY_THRESHOLD = 0.2
 TRAIN_EPOCHS = 2
@@ -26,3 +32,75 @@ EXTRACTION_TIMEOUT = 45
 MAX_RETRIES = 3
 BASE_DELAY = 1.0
 MAX_CONSECUTIVE_ERRORS = 5
+
+VECTOR_INDEX = "ivf"
+VECTOR_INDEX_FILE = f"{MODEL_DIR}/vector_index.npz"
+VECTOR_INDEX_MIN_DOCUMENTS = 10000
+IVF_N_LISTS = 0
+IVF_N_PROBE = 8
+IVF_TRAIN_ITERATIONS = 10
+ANN_CANDIDATE_FACTOR = 5
+
+RETRIEVE_BATCH_SIZE = 256
+MAX_BATCH_QUERIES = 1000
+
+# "int8" needs a quarter of the memory and scores as fast as "float32";
+# "float16" halves the memory but scores several times slower.
+EMBEDDING_PRECISION = "float32"
+RESCORE_CANDIDATES = 200
+
+RETRIEVAL_MODE = "dense"
+BM25_INDEX_FILE = f"{EMBEDDING_STORE_DIR}/bm25_index.npz"
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_CANDIDATES = 0
+RRF_K = 60
+RRF_DEPTH = 1000
+
+SIMILARITY_GRAPH_FILE = f"{EMBEDDING_STORE_DIR}/similarity_graph.npz"
+SIMILARITY_GRAPH_K = 50
+SIMILARITY_GRAPH_BLOCK_ROWS = 256
+SIMILARITY_GRAPH_WORKERS = 0
+
+FACET_FIELDS = ("date", "type", "language", "collections", "subjects_fos")
+FACET_MAX_VALUES = 20
+FILTER_EXACT_MAX_DOCUMENTS = 50000
+
+QUERY_RESULT_CACHE_MAX_ITEMS = 2048
+QUERY_RESULT_CACHE_TTL = 300
+
+QUERY_TOKENIZER = "regex"
+QUERY_PROCESSOR_CACHE_MAX_ITEMS = 4096
+
+PASSAGE_MODE = "off"
+PASSAGE_WORDS = 120
+PASSAGE_OVERLAP = 30
+PASSAGE_TOP_N = 2
+PASSAGE_ENCODE_BATCH_SIZE = 128
+
+NUM_SHARDS = 0
+# Pipes per shard worker. At most NUM_SHARD_CHANNELS queries (or query batches)
+# are scored by the shards at once; further callers wait for a free channel.
+NUM_SHARD_CHANNELS = 4
+
+ENCODE_BATCH_MAX_SIZE = 64
+ENCODE_BATCH_MAX_WAIT_MS = 3
+ENCODE_MAX_PENDING = 64
+ENCODE_QUEUE_TIMEOUT = 5.0
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 5000
+SERVE_THREADS = 16
+SERVE_WORKERS = 1
+
+HTTP_CACHE_MAX_AGE = 60
+HTTP_COMPRESS_MIN_BYTES = 1024
+HTTP_GZIP_LEVEL = 6
+HTTP_BROTLI_QUALITY = 5
+
+TRACE_ENABLED = False
+TRACE_BUFFER_SIZE = 256
+TRACE_SLOW_MS = 500
+TRACE_SLOW_LOG = "logs/slow_queries.jsonl"
+
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "text"
@@ -0,0 +1,98 @@
+import os
+import re
+import hashlib
+from typing import List
+import numpy as np
+from config import EMBEDDING_STORE_DIR
+from vector_index import embeddings_fingerprint
+
+
+class EmbeddingStore:
+    """Persists the prepared document matrix as one .npy file per model and collection.
+
+    Files are opened with np.load(mmap_mode="r"), so the matrix is paged in
+    lazily and shared between processes through the OS page cache. The
+    matrix fingerprint is written next to it, so indexes built from the
+    matrix can be validated on load without hashing the whole file.
+    """
+
+    def __init__(self, store_dir: str = EMBEDDING_STORE_DIR):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _model_prefix(self, model_name: str) -> str:
+        return re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+
+    def collection_hash(self, texts: List[str]) -> str:
+        digest = hashlib.md5()
+        for text in texts:
+            digest.update(text.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def store_key(self, model_name: str, texts: List[str]) -> str:
+        return f"{self._model_prefix(model_name)}_{self.collection_hash(texts)}"
+
+    def _store_path(self, store_key: str) -> str:
+        return os.path.join(self.store_dir, f"{store_key}.npy")
+
+    def _fingerprint_path(self, store_key: str) -> str:
+        return os.path.join(self.store_dir, f"{store_key}.fingerprint")
+
+    def _write_fingerprint(self, store_key: str, fingerprint: str) -> None:
+        fingerprint_path = self._fingerprint_path(store_key)
+        tmp_path = f"{fingerprint_path}.{os.getpid()}.tmp"
+
+        with open(tmp_path, "w") as f:
+            f.write(fingerprint)
+        os.replace(tmp_path, fingerprint_path)
+
+    def fingerprint(self, store_key: str, matrix: np.ndarray) -> str:
+        try:
+            with open(self._fingerprint_path(store_key)) as f:
+                return f.read().strip()
+        except OSError:
+            pass
+
+        # Stores written before fingerprints were kept get one on first use.
+        fingerprint = embeddings_fingerprint(matrix)
+        self._write_fingerprint(store_key, fingerprint)
+        return fingerprint
+
+    def load(self, store_key: str, n_rows: int) -> np.ndarray:
+        store_path = self._store_path(store_key)
+        if not os.path.exists(store_path):
+            return None
+
+        try:
+            matrix = np.load(store_path, mmap_mode="r")
+        except Exception:
+            os.remove(store_path)
+            return None
+
+        if matrix.ndim != 2 or matrix.shape[0] != n_rows:
+            return None
+
+        return matrix
+
+    def save(self, store_key: str, matrix: np.ndarray) -> np.ndarray:
+        store_path = self._store_path(store_key)
+        tmp_path = f"{store_path}.{os.getpid()}.tmp"
+
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, store_path)
+        self._write_fingerprint(store_key, embeddings_fingerprint(matrix))
+
+        model_prefix = store_key.rsplit("_", 1)[0]
+        stale_pattern = re.compile(
+            rf"{re.escape(model_prefix)}_[0-9a-f]{{32}}\.(npy|fingerprint)"
+        )
+        for filename in os.listdir(self.store_dir):
+            if stale_pattern.fullmatch(filename) and not filename.startswith(
+                f"{store_key}."
+            ):
+                os.remove(os.path.join(self.store_dir, filename))
+
+        return np.load(store_path, mmap_mode="r")
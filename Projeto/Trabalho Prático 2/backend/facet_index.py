@@ -0,0 +1,152 @@
+from typing import List, Dict, Any
+import numpy as np
+from config import FACET_FIELDS, FACET_MAX_VALUES
+
+
+class FacetIndex:
+    """One packed bitmap (np.packbits) per value of each metadata facet.
+
+    A filter is a handful of byte-wise OR/AND operations over n/8 bytes, and
+    facet counts are popcounts of each value bitmap against the filter mask.
+    Multi-valued fields (collections, subjects_fos) set one bit per value.
+    Each field's bitmaps are a view over a buffer that grows geometrically in
+    both values and bytes, so adding documents only sets the new bits.
+    """
+
+    def __init__(self, fields: tuple = FACET_FIELDS):
+        self.fields = fields
+        self.values = {}
+        self.value_ids = {}
+        self.bitmaps = {}
+        self._buffers = {}
+        self.n_docs = 0
+
+    def _document_values(self, doc: Dict[str, Any], field: str) -> List[str]:
+        value = doc.get(field)
+        if not value:
+            return []
+        if isinstance(value, list):
+            return [str(v) for v in value if v]
+        return [str(value)]
+
+    def build(self, documents: List[Dict[str, Any]]) -> None:
+        self.values = {field: [] for field in self.fields}
+        self.value_ids = {field: {} for field in self.fields}
+        self._buffers = {
+            field: np.zeros((0, (len(documents) + 7) // 8), dtype=np.uint8)
+            for field in self.fields
+        }
+        self.bitmaps = dict(self._buffers)
+        self.n_docs = 0
+        self.add_documents(documents, 0)
+
+    def add_documents(self, documents: List[Dict[str, Any]], start_index: int) -> None:
+        n_docs = start_index + len(documents)
+
+        for field in self.fields:
+            value_ids = self.value_ids[field]
+            rows, columns = [], []
+            for doc_index, doc in enumerate(documents, start_index):
+                for value in self._document_values(doc, field):
+                    if value not in value_ids:
+                        value_ids[value] = len(self.values[field])
+                        self.values[field].append(value)
+                    rows.append(value_ids[value])
+                    columns.append(doc_index)
+
+            bitmaps = self._reserve(field, len(self.values[field]), (n_docs + 7) // 8)
+
+            columns = np.array(columns, dtype=np.int64)
+            np.bitwise_or.at(
+                bitmaps,
+                (np.array(rows, dtype=np.int64), columns >> 3),
+                (128 >> (columns & 7)).astype(np.uint8),
+            )
+            self.bitmaps[field] = bitmaps
+
+        self.n_docs = n_docs
+
+    def _reserve(self, field: str, n_values: int, n_bytes: int) -> np.ndarray:
+        buffer = self._buffers[field]
+        rows, columns = buffer.shape
+        if n_values > rows or n_bytes > columns:
+            if n_values > rows:
+                rows = max(n_values, rows + rows // 2 + 16)
+            if n_bytes > columns:
+                columns = max(n_bytes, columns + columns // 2 + 16)
+            grown = np.zeros((rows, columns), dtype=np.uint8)
+            grown[: buffer.shape[0], : buffer.shape[1]] = buffer
+            self._buffers[field] = buffer = grown
+        return buffer[:n_values, :n_bytes]
+
+    def _selected_values(self, field: str, selection) -> List[int]:
+        value_ids = self.value_ids[field]
+
+        if isinstance(selection, dict):
+            unknown = set(selection) - {"from", "to"}
+            if unknown:
+                raise ValueError(
+                    f"Range filter on '{field}' only accepts 'from' and 'to'"
+                )
+            low, high = selection.get("from"), selection.get("to")
+            return [
+                value_id
+                for value, value_id in value_ids.items()
+                if (low is None or value >= str(low))
+                and (high is None or value <= str(high))
+            ]
+
+        if isinstance(selection, str):
+            selection = [selection]
+        if not isinstance(selection, list):
+            raise ValueError(
+                f"Filter on '{field}' must be a value, a list of values or a range"
+            )
+
+        return [value_ids[str(v)] for v in selection if str(v) in value_ids]
+
+    def filter_bitmap(self, filters: Dict[str, Any]) -> np.ndarray:
+        unknown = set(filters) - set(self.fields)
+        if unknown:
+            raise ValueError(
+                f"Unknown filter field(s): {', '.join(sorted(unknown))} (available: {', '.join(self.fields)})"
+            )
+
+        mask = np.full((self.n_docs + 7) // 8, 0xFF, dtype=np.uint8)
+        for field, selection in filters.items():
+            selected = self._selected_values(field, selection)
+            if not selected:
+                return np.zeros_like(mask)
+            np.bitwise_and(
+                mask,
+                np.bitwise_or.reduce(self.bitmaps[field][selected], axis=0),
+                out=mask,
+            )
+
+        return mask
+
+    def to_bitmap(self, mask: np.ndarray) -> np.ndarray:
+        return np.packbits(mask)
+
+    def to_mask(self, bitmap: np.ndarray) -> np.ndarray:
+        return np.unpackbits(bitmap, count=self.n_docs).view(bool)
+
+    def facet_counts(
+        self, bitmap: np.ndarray, max_values: int = FACET_MAX_VALUES
+    ) -> Dict[str, Dict[str, int]]:
+        facets = {}
+        for field in self.fields:
+            bitmaps = self.bitmaps[field]
+            if not len(bitmaps):
+                facets[field] = {}
+                continue
+
+            counts = np.bitwise_count(bitmaps & bitmap).sum(axis=1, dtype=np.int64)
+            order = np.argsort(-counts, kind="stable")[:max_values]
+            facets[field] = {
+                self.values[field][value_id]: int(counts[value_id])
+                for value_id in order
+                if counts[value_id]
+            }
+
+        return facets
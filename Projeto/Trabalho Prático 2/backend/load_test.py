@@ -0,0 +1,91 @@
+import sys
+import time
+import json
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+import numpy as np
+from colorama import Fore, Style, init
+
+init(autoreset=True)
+
+DEFAULT_URL = "http://127.0.0.1:5000"
+DEFAULT_CONCURRENCY = 16
+DEFAULT_REQUESTS = 500
+TOP_K = 10
+
+QUERIES = [
+    "machine learning",
+    "redes neurais artificiais",
+    "algoritmos de otimização para análise de dados",
+    "inteligência artificial",
+    "processamento de linguagem natural",
+    "visão por computador",
+    "segurança informática",
+    "engenharia de software",
+    "sistemas distribuídos",
+    "robótica móvel",
+]
+
+
+def search(url: str, query: str) -> Tuple[float, bool]:
+    payload = json.dumps({"query": query, "top_k": TOP_K}).encode()
+    request = urllib.request.Request(
+        f"{url}/api/search",
+        data=payload,
+        headers={"Content-Type": "application/json"},
+    )
+
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            ok = response.status == 200
+    except Exception:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run_load_test(
+    url: str, concurrency: int, n_requests: int
+) -> Tuple[float, List[float], int]:
+    queries = [QUERIES[i % len(QUERIES)] for i in range(n_requests)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda query: search(url, query), queries))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, ok in results if ok]
+    errors = sum(1 for _, ok in results if not ok)
+    return elapsed, latencies, errors
+
+
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_URL
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CONCURRENCY
+    n_requests = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_REQUESTS
+
+    print(f"{Fore.CYAN}Search API load test{Style.RESET_ALL}")
+    print("=" * 50)
+    print(
+        f"{Fore.YELLOW}{n_requests} requests to {url} with {concurrency} concurrent clients{Style.RESET_ALL}"
+    )
+
+    elapsed, latencies, errors = run_load_test(url, concurrency, n_requests)
+
+    if not latencies:
+        print(f"{Fore.RED}All {errors} requests failed{Style.RESET_ALL}")
+        return
+
+    latencies_ms = np.array(latencies) * 1000
+    print(f"{Fore.GREEN}QPS: {len(latencies) / elapsed:.1f}{Style.RESET_ALL}")
+    print(
+        f"{Fore.BLUE}Latency p50: {np.percentile(latencies_ms, 50):.1f} ms | p99: {np.percentile(latencies_ms, 99):.1f} ms | max: {latencies_ms.max():.1f} ms{Style.RESET_ALL}"
+    )
+    if errors:
+        print(f"{Fore.RED}Errors: {errors}/{n_requests}{Style.RESET_ALL}")
+
+
+if __name__ == "__main__":
+    main()
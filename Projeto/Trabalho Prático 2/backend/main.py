@@ -1,4 +1,5 @@
 import os
+import logging
 from config import *
 from data_extraction import CollectionExtractor
 from data_processing import DocumentProcessor
@@ -7,16 +8,29 @@ from model_trainer import SentenceTransformerTrainer
 from caching_system import PerformanceMonitor
 from data_validator import DataValidator
 from retrieval_system import InformationRetrievalSystem
-from utils import ensure_dir, load_json, save_json
+from utils import configure_logging, ensure_dir, load_json, save_json
 from colorama import Fore, Style, init
 
 init(autoreset=True)
 
 
+class ConsoleLogFormatter(logging.Formatter):
+    COLOURS = {
+        logging.DEBUG: Fore.BLUE,
+        logging.INFO: Fore.GREEN,
+        logging.WARNING: Fore.YELLOW,
+        logging.ERROR: Fore.RED,
+        logging.CRITICAL: Fore.RED,
+    }
+
+    def format(self, record):
+        return f"{self.COLOURS.get(record.levelno, '')}{super().format(record)}{Style.RESET_ALL}"
+
+
 def setup_directories():
     ensure_dir(DATA_DIR)
     ensure_dir(MODEL_DIR)
-    ensure_dir("cache")
+    ensure_dir(CACHE_DIR)
 
 
 def extract_data():
@@ -223,7 +237,7 @@ def search_by_document(ir_system, monitor):
         print(f"{'='*80}")
         
         for i, (doc, score) in enumerate(results, 1):
-            doc_idx = ir_system.documents.index(doc)
+            doc_idx = ir_system.get_document_index(doc.get("id"))
             print(f"\n{Fore.CYAN}{i}. [{doc_idx}] SCORE: {score:.4f}{Style.RESET_ALL}")
             print(f"{Fore.YELLOW}TITLE: {doc['title']}{Style.RESET_ALL}")
             print(f"{Fore.GREEN}AUTHORS: {', '.join(doc.get('authors', []))}{Style.RESET_ALL}")
@@ -236,7 +250,7 @@ def search_by_document(ir_system, monitor):
             selection_idx = int(selection) - 1
             if 0 <= selection_idx < len(results):
                 doc = results[selection_idx][0]
-                doc_idx = ir_system.documents.index(doc)
+                doc_idx = ir_system.get_document_index(doc.get("id"))
                 
                 monitor.start_timer("document_similarity")
                 ir_system.find_and_display_similar_documents(doc_idx, top_k=5)
@@ -277,6 +291,8 @@ def main():
     print(f"{Fore.MAGENTA}INFORMATION RETRIEVAL SYSTEM - REPOSITORIUM{Style.RESET_ALL}")
     print("=" * 60)
 
+    configure_logging(formatter=ConsoleLogFormatter("%(message)s"))
+
     total_monitor = PerformanceMonitor()
     total_monitor.start_timer("total_pipeline")
 
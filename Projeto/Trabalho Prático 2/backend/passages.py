@@ -0,0 +1,116 @@
+from typing import List
+import numpy as np
+from config import PASSAGE_WORDS, PASSAGE_OVERLAP, PASSAGE_TOP_N
+from vector_index import append_rows, normalize_rows
+
+PASSAGE_POOLINGS = ("max", "top_n")
+
+
+def split_passages(
+    text: str, passage_words: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP
+) -> List[str]:
+    words = text.split()
+    if len(words) <= passage_words:
+        return [text]
+
+    step = passage_words - overlap
+    return [
+        " ".join(words[start : start + passage_words])
+        for start in range(0, len(words) - overlap, step)
+    ]
+
+
+class PassageMatrix:
+    """Passage embeddings of every document plus a passage->document offset array.
+
+    Passages of document d are rows offsets[d]:offsets[d + 1], so query scores
+    are pooled per document with segment reductions over contiguous rows.
+    """
+
+    def __init__(self, pooling: str, top_n: int = PASSAGE_TOP_N):
+        if pooling not in PASSAGE_POOLINGS:
+            raise ValueError(
+                f"Unknown passage pooling '{pooling}' (available: {', '.join(PASSAGE_POOLINGS)})"
+            )
+
+        self.pooling = pooling
+        self.top_n = top_n
+        self.embeddings = None
+        self.offsets = None
+        self._buffer = None
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.offsets) - 1
+
+    def build(self, embeddings: np.ndarray, passage_counts: List[int]) -> None:
+        self.embeddings = embeddings
+        self.offsets = np.concatenate(([0], np.cumsum(passage_counts))).astype(np.int64)
+        self._buffer = embeddings
+
+    def add(self, embeddings: np.ndarray, passage_counts: List[int]) -> None:
+        n_rows = len(self.embeddings)
+        self._buffer = append_rows(self._buffer, n_rows, normalize_rows(embeddings))
+        self.embeddings = self._buffer[: n_rows + len(embeddings)]
+        self.offsets = np.concatenate(
+            (self.offsets, n_rows + np.cumsum(passage_counts))
+        ).astype(np.int64)
+
+    def score(
+        self,
+        query_embeddings: np.ndarray,
+        doc_indices: np.ndarray = None,
+        block_docs: int = 65536,
+    ) -> np.ndarray:
+        queries = normalize_rows(np.atleast_2d(query_embeddings))
+        n_docs = self.n_docs if doc_indices is None else len(doc_indices)
+        pooled = np.empty((len(queries), n_docs), dtype=np.float32)
+
+        for start in range(0, n_docs, block_docs):
+            end = min(start + block_docs, n_docs)
+
+            if doc_indices is None:
+                first, last = self.offsets[start], self.offsets[end]
+                passage_scores = queries @ self.embeddings[first:last].T
+                segment_starts = self.offsets[start:end] - first
+            else:
+                docs = doc_indices[start:end]
+                starts = self.offsets[docs]
+                lengths = self.offsets[docs + 1] - starts
+                segment_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+                passage_ids = np.repeat(starts - segment_starts, lengths) + np.arange(
+                    lengths.sum()
+                )
+                passage_scores = queries @ self.embeddings[passage_ids].T
+
+            pooled[:, start:end] = self._pool(passage_scores, segment_starts)
+
+        return pooled
+
+    def _pool(
+        self, passage_scores: np.ndarray, segment_starts: np.ndarray
+    ) -> np.ndarray:
+        if not len(segment_starts):
+            return np.empty((len(passage_scores), 0), dtype=np.float32)
+
+        if self.pooling == "max":
+            return np.maximum.reduceat(passage_scores, segment_starts, axis=1)
+
+        # Mean of the top_n passages: take the segment max top_n times, each
+        # time knocking out the first passage that attained it.
+        lengths = np.diff(np.append(segment_starts, passage_scores.shape[1]))
+        scores = passage_scores.copy()
+        pooled = np.zeros((len(scores), len(segment_starts)), dtype=np.float32)
+
+        for _ in range(self.top_n):
+            best = np.maximum.reduceat(scores, segment_starts, axis=1)
+            pooled += np.where(best > -np.inf, best, 0.0)
+
+            hits = scores == np.repeat(best, lengths, axis=1)
+            seen = np.cumsum(hits, axis=1)
+            seen_before = seen[:, segment_starts] - hits[:, segment_starts]
+            scores[hits & (seen - np.repeat(seen_before, lengths, axis=1) == 1)] = (
+                -np.inf
+            )
+
+        return pooled / np.minimum(lengths, self.top_n)
@@ -0,0 +1,121 @@
+from typing import List, Tuple
+import numpy as np
+from vector_index import append_rows, include_rows, normalize_rows, top_k_indices
+
+PRECISIONS = ("float32", "float16", "int8")
+
+# float16 bits shifted into float32 position read as value * 2**-112.
+HALF_BITS_SCALE = 2.0**112
+
+
+class QuantizedMatrix:
+    """Compressed copy of the normalized document matrix used for first-pass scoring.
+
+    int8 codes use one scale per dimension; the scale is folded into the query so
+    scoring is a plain matrix product. Blocks are widened to float32 on the fly,
+    so the full matrix never exists in float32 in memory. float16 blocks are
+    widened with integer shifts (numpy's float16 astype is much slower): the
+    half's bits moved into float32 position are the value times 2**-112, which
+    is folded into the query like the int8 scales. Even so, float16 scoring
+    stays several times slower than float32; int8 is the fast compressed mode.
+    """
+
+    def __init__(self, precision: str, block_rows: int = 256):
+        if precision not in PRECISIONS[1:]:
+            raise ValueError(
+                f"Unknown embedding precision '{precision}' (available: {', '.join(PRECISIONS)})"
+            )
+
+        self.precision = precision
+        self.block_rows = block_rows
+        self.codes = None
+        self.scales = None
+        self._codes_buffer = None
+
+    def build(self, matrix: np.ndarray) -> None:
+        if self.precision == "float16":
+            self.codes = np.empty(matrix.shape, dtype=np.float16)
+            for start in range(0, len(matrix), self.block_rows):
+                block = matrix[start : start + self.block_rows]
+                self.codes[start : start + self.block_rows] = block
+            return
+
+        max_abs = np.zeros(matrix.shape[1], dtype=np.float32)
+        for start in range(0, len(matrix), self.block_rows):
+            block = np.abs(matrix[start : start + self.block_rows])
+            np.maximum(max_abs, block.max(axis=0), out=max_abs)
+
+        self.scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+        self.codes = np.empty(matrix.shape, dtype=np.int8)
+        for start in range(0, len(matrix), self.block_rows):
+            block = matrix[start : start + self.block_rows]
+            self.codes[start : start + self.block_rows] = np.clip(
+                np.rint(block / self.scales), -127, 127
+            )
+
+    def add(self, rows: np.ndarray) -> None:
+        if self.scales is None:
+            new_codes = rows.astype(np.float16)
+        else:
+            new_codes = np.clip(np.rint(rows / self.scales), -127, 127).astype(np.int8)
+
+        n_rows = len(self.codes)
+        if self._codes_buffer is None:
+            self._codes_buffer = self.codes
+        self._codes_buffer = append_rows(self._codes_buffer, n_rows, new_codes)
+        self.codes = self._codes_buffer[: n_rows + len(new_codes)]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def scores(self, query_embeddings: np.ndarray) -> np.ndarray:
+        queries = normalize_rows(np.atleast_2d(query_embeddings))
+        if self.scales is not None:
+            queries = queries * self.scales
+            widen = self._widen_int8
+        else:
+            queries = (queries * HALF_BITS_SCALE).astype(np.float32)
+            widen = self._widen_float16
+
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), self.block_rows):
+            block = widen(self.codes[start : start + self.block_rows])
+            scores[:, start : start + len(block)] = queries @ block.T
+
+        return scores
+
+    def _widen_int8(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32)
+
+    def _widen_float16(self, codes: np.ndarray) -> np.ndarray:
+        half = codes.view(np.uint16)
+        bits = np.bitwise_and(half, 0x7FFF, dtype=np.uint32)
+        np.left_shift(bits, 13, out=bits)
+        sign = np.bitwise_and(half, 0x8000, dtype=np.uint32)
+        np.left_shift(sign, 16, out=sign)
+        np.bitwise_or(bits, sign, out=bits)
+        return bits.view(np.float32)
+
+    def search(
+        self,
+        query_embeddings: np.ndarray,
+        full_matrix: np.ndarray,
+        n_candidates: int,
+        include: List[np.ndarray] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        queries = normalize_rows(np.atleast_2d(query_embeddings))
+
+        results = []
+        for position, (query, approximate) in enumerate(
+            zip(queries, self.scores(queries))
+        ):
+            candidates = np.sort(top_k_indices(approximate, n_candidates))
+            candidate_scores = full_matrix[candidates] @ query
+            if include is not None:
+                candidates, candidate_scores = include_rows(
+                    candidates, candidate_scores, include[position], full_matrix, query
+                )
+            results.append((candidates, candidate_scores))
+
+        return results
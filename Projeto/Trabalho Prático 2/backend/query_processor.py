@@ -1,13 +1,65 @@
-from typing import List, Dict, Any
-from utils import clean_text, extract_keywords
-from colorama import Fore, Style, init
-
-init(autoreset=True)
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Callable
+from config import QUERY_TOKENIZER, QUERY_PROCESSOR_CACHE_MAX_ITEMS
+from utils import KEYWORD_TOKEN_PATTERN, clean_text, ensure_nltk_data, get_stopwords
 
 
 class QueryProcessor:
-    def __init__(self):
-        pass
+    """Query cleaning and keyword extraction with per-language resources.
+
+    Stopword sets are frozen once per language and tokenization uses a
+    compiled regex that approximates nltk's word_tokenize. It gives the same
+    keywords on the collection and on the contractions word_tokenize splits,
+    but punctuation corner cases can still change keywords (and so the
+    enhanced query); `tokenizer="nltk"` keeps the exact original behaviour.
+    Processed queries are kept in an LRU, since the same queries keep coming
+    back.
+    """
+
+    def __init__(
+        self,
+        tokenizer: str = QUERY_TOKENIZER,
+        cache_max_items: int = QUERY_PROCESSOR_CACHE_MAX_ITEMS,
+    ):
+        self.tokenizer = tokenizer
+        self.cache_max_items = cache_max_items
+        self._stopwords = {}
+        self._tokenize = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_tokenizer(self) -> Callable[[str], List[str]]:
+        if self._tokenize is None:
+            if self.tokenizer == "nltk":
+                ensure_nltk_data()
+                from nltk.tokenize import word_tokenize
+
+                self._tokenize = word_tokenize
+            else:
+                self._tokenize = KEYWORD_TOKEN_PATTERN.findall
+        return self._tokenize
+
+    def _get_stopwords(self, language: str) -> frozenset:
+        stop_words = self._stopwords.get(language)
+        if stop_words is None:
+            stop_words = self._stopwords[language] = get_stopwords(language)
+        return stop_words
+
+    def extract_keywords(self, text: str, language: str = "portuguese") -> List[str]:
+        if not text:
+            return []
+
+        tokens = self._get_tokenizer()(text.lower())
+        stop_words = self._get_stopwords(language)
+
+        return [
+            token
+            for token in tokens
+            if token.isalpha() and len(token) > 2 and token not in stop_words
+        ]
 
     def process_query(self, query: str, language: str = "portuguese") -> Dict[str, Any]:
         if not query or not query.strip():
@@ -18,16 +70,36 @@ class QueryProcessor:
                 "query_type": "empty",
             }
 
-        cleaned_query = clean_text(query)
-        keywords = extract_keywords(cleaned_query, language)
-        query_type = self._determine_query_type(keywords)
-
-        processed_query = " ".join(keywords)
+        key = (query, language)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if cached is None:
+            cleaned_query = clean_text(query)
+            keywords = self.extract_keywords(cleaned_query, language)
+            cached = (
+                tuple(keywords),
+                " ".join(keywords),
+                self._determine_query_type(keywords),
+            )
+
+            if self.cache_max_items > 0:
+                with self._lock:
+                    self._cache[key] = cached
+                    while len(self._cache) > self.cache_max_items:
+                        self._cache.popitem(last=False)
+
+        keywords, processed_query, query_type = cached
 
         return {
             "original_query": query,
             "processed_query": processed_query,
-            "keywords": keywords,
+            "keywords": list(keywords),
             "query_type": query_type,
         }
 
@@ -51,8 +123,23 @@ class QueryProcessor:
 
         return enhanced_query
 
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._cache),
+            "max_items": self.cache_max_items,
+            "tokenizer": self.tokenizer,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
 
 def main():
+    from colorama import Fore, Style, init
+
+    init(autoreset=True)
+
     processor = QueryProcessor()
 
     test_queries = [
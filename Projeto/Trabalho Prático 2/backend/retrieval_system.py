@@ -1,99 +1,682 @@
+import json
+import logging
+import time
 import numpy as np
 from typing import List, Dict, Any, Tuple
-from sentence_transformers import SentenceTransformer
 from config import *
-from utils import load_json
+from utils import ensure_nltk_data, load_json, save_json
 from query_processor import QueryProcessor
-from caching_system import EmbeddingCache
-from colorama import Fore, Style, init
-
-init(autoreset=True)
+from caching_system import (
+    EmbeddingCache,
+    PerformanceMonitor,
+    QueryResultCache,
+    timed,
+)
+from concurrency import EncodeBatcher, ReadWriteLock, read_locked, write_locked
+from embedding_store import EmbeddingStore
+from boost_index import EMPTY_POSTINGS, BoostIndex
+from bm25_index import BM25Index
+from facet_index import FacetIndex
+from quantization import QuantizedMatrix
+from passages import PassageMatrix, split_passages
+from serialization import DocumentFragments
+from sharding import ShardedScorer
+from tracing import RequestTracer, trace_flag
+from similarity_graph import SimilarityGraph
+from vector_index import (
+    append_rows,
+    create_vector_index,
+    include_rows,
+    normalize_rows,
+    top_k_indices,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class InformationRetrievalSystem:
     def __init__(self, model_path: str = MODEL_DIR):
+        self.lock = ReadWriteLock()
+        self.monitor = PerformanceMonitor()
+        self.tracer = RequestTracer()
         self.model = None
+        self.encoder = None
         self.documents = []
+        self.id_to_index = {}
         self.document_embeddings = None
+        self.embeddings_fingerprint = None
+        self.deleted = np.zeros(0, dtype=bool)
+        self.n_deleted = 0
+        self._embedding_buffer = None
+        self._deleted_buffer = None
+        self.vector_index = None
+        self.quantized_embeddings = None
+        self.passages = None
+        self.shards = None
+        self.similarity_graph = None
+        self.boost_index = BoostIndex()
+        self.bm25_index = None
+        self.facet_index = FacetIndex()
+        self.fragments = DocumentFragments()
         self.query_processor = QueryProcessor()
         self.cache = EmbeddingCache()
+        self.embedding_store = EmbeddingStore()
+        self.result_cache = QueryResultCache()
+        self.collection_version = 0
+        self.collection_modified = time.time()
         self.load_model(model_path)
 
+    @write_locked
     def load_model(self, model_path: str) -> None:
+        from sentence_transformers import SentenceTransformer
+
         try:
             self.model = SentenceTransformer(model_path)
-            print(f"{Fore.GREEN}Model loaded from: {model_path}{Style.RESET_ALL}")
+            logger.info("Model loaded from: %s", model_path)
         except:
-            print(f"{Fore.RED}Error loading model from: {model_path}{Style.RESET_ALL}")
-            print(f"{Fore.YELLOW}Loading base model...{Style.RESET_ALL}")
+            logger.warning(
+                "Could not load model from %s, loading base model %s",
+                model_path,
+                BASE_MODEL,
+            )
             self.model = SentenceTransformer(BASE_MODEL)
 
+        if self.encoder is not None:
+            self.encoder.shutdown()
+        self.encoder = EncodeBatcher(self.model)
+        self._bump_version()
+
+    @read_locked
+    def warmup(self, encode: bool = True) -> None:
+        # Pays the one-off costs (NLTK data, tokenizer and model kernels,
+        # first pass over the matrices) before the first request does.
+        # encode=False skips the model: a process about to fork must not start
+        # torch's thread pool, so its workers warm the model up after fork.
+        start = time.perf_counter()
+        ensure_nltk_data()
+
+        processed_query_data = self.query_processor.process_query("warmup query")
+        final_query = self.query_processor.enhance_query_for_similarity(
+            processed_query_data
+        )
+        embedding = None
+        if encode:
+            embedding = self.encoder.encode([final_query])
+
+        if self.documents and self.document_embeddings is not None:
+            if embedding is None:
+                embedding = np.asarray(self.document_embeddings[:1])
+            self._score_documents(embedding, 1)
+
+        logger.info("Warmup done in %.2fs", time.perf_counter() - start)
+
+    @write_locked
     def load_collection(self, filepath: str = JSON_FILE) -> None:
         self.documents = load_json(filepath)
-        print(f"{Fore.GREEN}Loaded {len(self.documents)} documents{Style.RESET_ALL}")
+        logger.info("Loaded %s documents", len(self.documents))
 
+        self._build_id_lookup()
+        self.boost_index.build(self.documents)
+        self.facet_index.build(self.documents)
+        self.fragments.build(self.documents)
+        self._build_bm25_index()
         self._precompute_embeddings()
 
-    def _precompute_embeddings(self) -> None:
-        print(f"{Fore.CYAN}Checking document embedding cache...{Style.RESET_ALL}")
+        self.deleted = np.zeros(len(self.documents), dtype=bool)
+        self.n_deleted = 0
+        self._embedding_buffer = self.document_embeddings
+        self._deleted_buffer = self.deleted
+        self._bump_version()
+
+    @write_locked
+    def add_documents(self, documents: List[Dict[str, Any]]) -> int:
+        if self.document_embeddings is None:
+            raise ValueError("Collection not loaded")
+
+        for doc in documents:
+            if not isinstance(doc, dict) or not all(
+                doc.get(field) for field in ("id", "title", "abstract")
+            ):
+                raise ValueError(
+                    "Documents need non-empty 'id', 'title' and 'abstract'"
+                )
+
+        documents = list({doc["id"]: doc for doc in documents}.values())
+        if not documents:
+            return 0
 
+        # Everything that can fail (the encodes) runs before the collection is
+        # touched, so a failed update leaves the previous version in place.
         model_name = self.model._modules["0"].auto_model.config.name_or_path
-        abstracts = [doc["abstract"] for doc in self.documents]
+        embeddings = normalize_rows(
+            self._embed_abstracts([doc["abstract"] for doc in documents], model_name)
+        )
+        if self.passages is not None:
+            doc_passages = [split_passages(doc["abstract"]) for doc in documents]
+            passage_embeddings = self._embed_abstracts(
+                [passage for passages in doc_passages for passage in passages],
+                model_name,
+                PASSAGE_ENCODE_BATCH_SIZE,
+            )
+
+        self.remove_documents(
+            [doc["id"] for doc in documents if doc["id"] in self.id_to_index]
+        )
 
-        cached_embeddings = self.cache.batch_get_embeddings(abstracts, model_name)
+        start_index = len(self.documents)
+        end_index = start_index + len(documents)
 
-        if len(cached_embeddings) == len(abstracts):
-            print(
-                f"{Fore.GREEN}✅ All {len(abstracts)} embeddings found in cache!{Style.RESET_ALL}"
+        self._embedding_buffer = append_rows(
+            self._embedding_buffer, start_index, embeddings
+        )
+        self._deleted_buffer = append_rows(
+            self._deleted_buffer, start_index, np.zeros(len(documents), dtype=bool)
+        )
+        self.document_embeddings = self._embedding_buffer[:end_index]
+        self.embeddings_fingerprint = None
+        self.deleted = self._deleted_buffer[:end_index]
+
+        self.documents.extend(documents)
+        for doc_index, doc in enumerate(documents, start_index):
+            self.id_to_index[doc["id"]] = doc_index
+
+        self.boost_index.add_documents(documents, start_index)
+        self.facet_index.add_documents(documents, start_index)
+        self.fragments.add_documents(documents)
+        if self.bm25_index is not None:
+            self.bm25_index.add_documents(documents, start_index)
+        if self.vector_index is not None:
+            self.vector_index.add(embeddings, np.arange(start_index, end_index))
+        if self.quantized_embeddings is not None:
+            self.quantized_embeddings.add(embeddings)
+        if self.passages is not None:
+            self.passages.add(
+                passage_embeddings, [len(passages) for passages in doc_passages]
+            )
+        if self.similarity_graph is not None:
+            # New documents can enter any neighbour list, so the graph is stale.
+            self.similarity_graph = None
+            logger.warning(
+                "Similarity graph invalidated, rerun build_similarity_graph.py"
             )
-            self.document_embeddings = np.array(
-                [cached_embeddings[abstract] for abstract in abstracts]
+        self._bump_version()
+
+        logger.info("Added %s documents", len(documents))
+        return len(documents)
+
+    @write_locked
+    def update_document(self, document: Dict[str, Any]) -> None:
+        if not isinstance(document, dict) or document.get("id") not in self.id_to_index:
+            raise ValueError("Document not found")
+
+        self.add_documents([document])
+
+    @write_locked
+    def remove_documents(self, doc_ids: List[str]) -> int:
+        removed_documents = []
+        for doc_id in doc_ids:
+            doc_index = self.id_to_index.pop(doc_id, None)
+            if doc_index is not None:
+                self.deleted[doc_index] = True
+                removed_documents.append(self.documents[doc_index])
+
+        if self.bm25_index is not None and removed_documents:
+            self.bm25_index.remove_documents(removed_documents)
+
+        removed = len(removed_documents)
+        self.n_deleted += removed
+        if removed:
+            self._bump_version()
+            logger.info("Removed %s documents", removed)
+        return removed
+
+    def _bump_version(self) -> None:
+        self.collection_version += 1
+        self.collection_modified = time.time()
+        self.result_cache.clear()
+
+    @read_locked
+    def collection_state(self) -> Tuple[int, float]:
+        return self.collection_version, self.collection_modified
+
+    @read_locked
+    def document_count(self) -> int:
+        return len(self.documents) - self.n_deleted
+
+    @read_locked
+    def get_documents_page(self, start: int, end: int) -> List[Dict[str, Any]]:
+        return [self.documents[i] for i in self.document_page_indices(start, end)]
+
+    @read_locked
+    def document_page_indices(self, start: int, end: int) -> np.ndarray:
+        if not self.n_deleted:
+            return np.arange(len(self.documents))[start:end]
+        return np.flatnonzero(~self.deleted)[start:end]
+
+    @read_locked
+    def document_fragments(
+        self,
+        doc_indices: List[int],
+        fields: List[str] = None,
+        abstract_chars: int = None,
+    ) -> List[bytes]:
+        return [
+            self.fragments.fragment(doc_index, fields, abstract_chars)
+            for doc_index in doc_indices
+        ]
+
+    @read_locked
+    def save_collection(self, filepath: str = JSON_FILE) -> None:
+        live_indices = np.flatnonzero(~self.deleted)
+        documents = [self.documents[i] for i in live_indices]
+        save_json(documents, filepath)
+
+        model_name = self.model._modules["0"].auto_model.config.name_or_path
+        store_key = self.embedding_store.store_key(
+            model_name, [doc["abstract"] for doc in documents]
+        )
+        self.embedding_store.save(store_key, self.document_embeddings[live_indices])
+
+        logger.info("Saved %s documents to: %s", len(documents), filepath)
+
+    def _build_id_lookup(self) -> None:
+        self.id_to_index = {}
+        for idx, doc in enumerate(self.documents):
+            doc_id = doc.get("id")
+            if doc_id is not None:
+                self.id_to_index.setdefault(doc_id, idx)
+
+    def _precompute_embeddings(self) -> None:
+        model_name = self.model._modules["0"].auto_model.config.name_or_path
+        abstracts = [doc["abstract"] for doc in self.documents]
+
+        store_key = self.embedding_store.store_key(model_name, abstracts)
+        stored_embeddings = self.embedding_store.load(store_key, len(abstracts))
+
+        if stored_embeddings is not None:
+            logger.info(
+                "Document matrix memory-mapped from %s (%s embeddings)",
+                self.embedding_store.store_dir,
+                len(abstracts),
             )
+            self.document_embeddings = stored_embeddings
         else:
-            print(
-                f"{Fore.BLUE}📊 Cache: {len(cached_embeddings)}/{len(abstracts)} embeddings found{Style.RESET_ALL}"
+            embeddings = normalize_rows(self._embed_abstracts(abstracts, model_name))
+            self.document_embeddings = self.embedding_store.save(store_key, embeddings)
+            logger.info("Document matrix saved to %s", self.embedding_store.store_dir)
+        self.embeddings_fingerprint = self.embedding_store.fingerprint(
+            store_key, self.document_embeddings
+        )
+
+        logger.info("Document embeddings ready!")
+
+        self._build_passages(model_name)
+        self._build_vector_index()
+        self._build_quantized_embeddings()
+        self._start_shards()
+        self._load_similarity_graph()
+
+    def _start_shards(self) -> None:
+        if self.shards is not None:
+            self.shards.close()
+            self.shards = None
+
+        if NUM_SHARDS <= 0:
+            return
+
+        if (
+            self.vector_index is not None
+            or self.quantized_embeddings is not None
+            or self.passages is not None
+        ):
+            logger.warning(
+                "Sharding only applies to exhaustive document scoring, skipping"
             )
-            print(f"{Fore.YELLOW}Computing missing embeddings...{Style.RESET_ALL}")
+            return
 
-            uncached_abstracts = [
-                abstract for abstract in abstracts if abstract not in cached_embeddings
-            ]
+        store_path = getattr(self.document_embeddings, "filename", None)
+        if store_path is None:
+            return
 
-            if uncached_abstracts:
-                new_embeddings = self.model.encode(
-                    uncached_abstracts, show_progress_bar=True, convert_to_numpy=True
-                )
+        shards = ShardedScorer(
+            store_path, len(self.document_embeddings), NUM_SHARDS, NUM_SHARD_CHANNELS
+        )
+        shards.start()
+        self.shards = shards
+
+    def _load_similarity_graph(self) -> None:
+        self.similarity_graph = None
+
+        graph = SimilarityGraph()
+        if graph.load(
+            SIMILARITY_GRAPH_FILE, self.document_embeddings, self.embeddings_fingerprint
+        ):
+            self.similarity_graph = graph
+            logger.info(
+                "Similarity graph loaded from: %s (k=%s)",
+                SIMILARITY_GRAPH_FILE,
+                graph.k,
+            )
 
-                embedding_pairs = list(zip(uncached_abstracts, new_embeddings))
-                self.cache.batch_store_embeddings(embedding_pairs, model_name)
-                print(
-                    f"{Fore.GREEN}💾 {len(uncached_abstracts)} new embeddings saved to cache{Style.RESET_ALL}"
+    def build_similarity_graph(
+        self, k: int = SIMILARITY_GRAPH_K, n_workers: int = SIMILARITY_GRAPH_WORKERS
+    ) -> SimilarityGraph:
+        graph = SimilarityGraph(k)
+
+        # Scoring only needs the read lock; the graph is swapped in afterwards
+        # unless the collection changed in the meantime.
+        with self.lock.read():
+            if self.document_embeddings is None:
+                raise ValueError("Collection not loaded")
+            version = self.collection_version
+            graph.build(
+                self.document_embeddings, n_workers, self.embeddings_fingerprint
+            )
+
+        with self.lock.write():
+            if self.collection_version != version:
+                raise ValueError("Collection changed while building the graph")
+            graph.save(SIMILARITY_GRAPH_FILE)
+            self.similarity_graph = graph
+
+        logger.info("Similarity graph saved to: %s", SIMILARITY_GRAPH_FILE)
+        return graph
+
+    def _build_quantized_embeddings(self) -> None:
+        self.quantized_embeddings = None
+
+        if EMBEDDING_PRECISION == "float32":
+            return
+
+        quantized = QuantizedMatrix(EMBEDDING_PRECISION)
+        quantized.build(self.document_embeddings)
+        self.quantized_embeddings = quantized
+
+        logger.info(
+            "Quantized document matrix (%s): %.1f MiB vs %.1f MiB float32",
+            EMBEDDING_PRECISION,
+            quantized.nbytes / 2**20,
+            self.document_embeddings.nbytes / 2**20,
+        )
+        if EMBEDDING_PRECISION == "float16":
+            logger.warning(
+                "float16 first-pass scoring is several times slower than float32 "
+                "(numpy has no fast float16 matmul); use int8 for compressed "
+                "and fast scoring"
+            )
+
+    def _build_passages(self, model_name: str) -> None:
+        self.passages = None
+
+        if PASSAGE_MODE == "off":
+            return
+
+        passage_matrix = PassageMatrix(PASSAGE_MODE)
+        doc_passages = [split_passages(doc["abstract"]) for doc in self.documents]
+        passages = [passage for doc in doc_passages for passage in doc]
+
+        store_key = self.embedding_store.store_key(
+            f"{model_name}-passages-{PASSAGE_WORDS}-{PASSAGE_OVERLAP}", passages
+        )
+        embeddings = self.embedding_store.load(store_key, len(passages))
+
+        if embeddings is None:
+            embeddings = self.embedding_store.save(
+                store_key,
+                normalize_rows(
+                    self._embed_abstracts(
+                        passages, model_name, PASSAGE_ENCODE_BATCH_SIZE
+                    )
+                ),
+            )
+
+        passage_matrix.build(embeddings, [len(doc) for doc in doc_passages])
+        self.passages = passage_matrix
+
+        logger.info(
+            "Passage matrix ready: %s passages for %s documents (%s pooling)",
+            len(passages),
+            len(doc_passages),
+            PASSAGE_MODE,
+        )
+
+    def _embed_abstracts(
+        self, abstracts: List[str], model_name: str, batch_size: int = 32
+    ) -> np.ndarray:
+        logger.info("Checking document embedding cache...")
+
+        cached_embeddings = self.cache.batch_get_embeddings(
+            abstracts, model_name, remember=False
+        )
+
+        if len(cached_embeddings) == len(abstracts):
+            logger.info("All %s embeddings found in cache!", len(abstracts))
+        else:
+            logger.info(
+                "Cache: %s/%s embeddings found", len(cached_embeddings), len(abstracts)
+            )
+            logger.info("Computing missing embeddings...")
+
+            uncached_abstracts = list(
+                dict.fromkeys(
+                    abstract
+                    for abstract in abstracts
+                    if abstract not in cached_embeddings
                 )
+            )
 
-            all_embeddings = []
-            for abstract in abstracts:
-                if abstract in cached_embeddings:
-                    all_embeddings.append(cached_embeddings[abstract])
-                else:
-                    embedding = self.model.encode([abstract], convert_to_numpy=True)[0]
-                    all_embeddings.append(embedding)
-                    self.cache.store_embedding(abstract, model_name, embedding)
+            new_embeddings = self.model.encode(
+                uncached_abstracts,
+                batch_size=batch_size,
+                show_progress_bar=True,
+                convert_to_numpy=True,
+            )
 
-            self.document_embeddings = np.array(all_embeddings)
+            embedding_pairs = list(zip(uncached_abstracts, new_embeddings))
+            self.cache.batch_store_embeddings(
+                embedding_pairs, model_name, remember=False
+            )
+            cached_embeddings.update(embedding_pairs)
+            logger.info("%s new embeddings saved to cache", len(uncached_abstracts))
 
         cache_stats = self.cache.get_cache_stats()
-        print(
-            f"{Fore.BLUE}📈 Cache stats: {cache_stats['memory_cached_items']} in memory, {cache_stats['disk_cached_items']} on disk{Style.RESET_ALL}"
+        logger.info(
+            "Cache stats: %s in memory, %s on disk",
+            cache_stats["memory_cached_items"],
+            cache_stats["disk_cached_items"],
         )
-        print(f"{Fore.GREEN}Document embeddings ready!{Style.RESET_ALL}")
+
+        return np.array([cached_embeddings[abstract] for abstract in abstracts])
+
+    def _build_bm25_index(self) -> None:
+        self.bm25_index = None
+
+        if RETRIEVAL_MODE == "dense" and not BM25_CANDIDATES:
+            return
+        if RETRIEVAL_MODE not in ("dense", "hybrid"):
+            raise ValueError(
+                f"Unknown retrieval mode '{RETRIEVAL_MODE}' (available: dense, hybrid)"
+            )
+
+        bm25_index = BM25Index()
+        if bm25_index.load(BM25_INDEX_FILE, self.documents):
+            logger.info("BM25 index loaded from: %s", BM25_INDEX_FILE)
+        else:
+            bm25_index.build(self.documents)
+            bm25_index.save(BM25_INDEX_FILE)
+            logger.info("BM25 index saved to: %s", BM25_INDEX_FILE)
+
+        self.bm25_index = bm25_index
+
+    def _build_vector_index(self) -> None:
+        self.vector_index = None
+
+        if len(self.documents) < VECTOR_INDEX_MIN_DOCUMENTS:
+            return
+
+        vector_index = create_vector_index(VECTOR_INDEX)
+        if vector_index is None:
+            return
+
+        if vector_index.load(
+            VECTOR_INDEX_FILE, self.document_embeddings, self.embeddings_fingerprint
+        ):
+            logger.info("Vector index loaded from: %s", VECTOR_INDEX_FILE)
+        else:
+            vector_index.build(self.document_embeddings, self.embeddings_fingerprint)
+            vector_index.save(VECTOR_INDEX_FILE)
+            logger.info("Vector index saved to: %s", VECTOR_INDEX_FILE)
+
+        self.vector_index = vector_index
 
     def retrieve(
-        self, query: str, top_k: int = 10
+        self, query: str, top_k: int = 10, filters: Dict[str, Any] = None
     ) -> List[Tuple[Dict[str, Any], float]]:
+        return self.retrieve_batch([query], top_k, filters)[0]
+
+    @read_locked
+    def retrieve_batch(
+        self, queries: List[str], top_k: int = 10, filters: Dict[str, Any] = None
+    ) -> List[List[Tuple[Dict[str, Any], float]]]:
+        with self.tracer.trace("retrieve", {"queries": queries, "top_k": top_k}):
+            return [
+                [
+                    (self.documents[doc_index], float(score))
+                    for doc_index, score in zip(indices.tolist(), scores.tolist())
+                ]
+                for indices, scores in self.rank_batch(queries, top_k, filters)
+            ]
+
+    @read_locked
+    @timed("rank")
+    def rank_batch(
+        self, queries: List[str], top_k: int = 10, filters: Dict[str, Any] = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
         if not self.documents or self.document_embeddings is None:
             raise ValueError("Collection not loaded")
 
-        print(f"{Fore.CYAN}Processing query: '{query}'{Style.RESET_ALL}")
+        with self.monitor.span("query_processing"):
+            prepared_queries = [self._prepare_query(query) for query in queries]
+
+        filters_key = (
+            json.dumps(filters, sort_keys=True, default=str) if filters else ""
+        )
+        cache_keys = [
+            (final_query, top_k, filters_key, self.collection_version)
+            for _, final_query in prepared_queries
+        ]
+        ranked = [self.result_cache.get(key) for key in cache_keys]
+        pending = [i for i, result in enumerate(ranked) if result is None]
+        trace_flag("result_cache_hits", len(queries) - len(pending))
+        trace_flag("result_cache_misses", len(pending))
+
+        if len(pending) < len(queries):
+            logger.debug(
+                "%s/%s results found in cache",
+                len(queries) - len(pending),
+                len(queries),
+            )
+
+        if pending:
+            allowed = self._allowed_mask(filters)
+            pending_queries = [prepared_queries[i] for i in pending]
+
+            query_embeddings = self._get_query_embeddings(
+                [final_query for _, final_query in pending_queries]
+            )
+            lexical_results = [
+                self._lexical_search(processed_query_data, allowed)
+                for processed_query_data, _ in pending_queries
+            ]
+            # Approximate and sharded scoring cut the candidate list before
+            # the boost; boosted documents are merged back in exactly.
+            boosted = None
+            if self.passages is None and (
+                self.vector_index is not None
+                or self.quantized_embeddings is not None
+                or (self.shards is not None and not self.shards.failed)
+            ):
+                boosted = [
+                    (
+                        self.boost_index.boost_factors(keywords)[0]
+                        if keywords
+                        else EMPTY_POSTINGS
+                    )
+                    for keywords in (data["keywords"] for data, _ in pending_queries)
+                ]
+
+            for start in range(0, len(pending), RETRIEVE_BATCH_SIZE):
+                end = start + RETRIEVE_BATCH_SIZE
+                candidates = self._score_queries(
+                    query_embeddings[start:end],
+                    top_k,
+                    lexical_results[start:end],
+                    allowed,
+                    None if boosted is None else boosted[start:end],
+                )
+
+                for (
+                    position,
+                    (processed_query_data, _),
+                    lexical,
+                    (
+                        candidate_indices,
+                        similarities,
+                    ),
+                ) in zip(
+                    pending[start:end],
+                    pending_queries[start:end],
+                    lexical_results[start:end],
+                    candidates,
+                ):
+                    ranked[position] = self._rank_candidates(
+                        processed_query_data,
+                        candidate_indices,
+                        similarities,
+                        top_k,
+                        lexical,
+                        allowed,
+                    )
+                    self.result_cache.put(cache_keys[position], *ranked[position])
+
+        return ranked
+
+    @read_locked
+    def facet_counts(self, filters: Dict[str, Any] = None) -> Dict[str, Dict[str, int]]:
+        return self.facet_index.facet_counts(self._filter_bitmap(filters or {}))
+
+    def _filter_bitmap(self, filters: Dict[str, Any]) -> np.ndarray:
+        bitmap = self.facet_index.filter_bitmap(filters)
+        if self.n_deleted:
+            bitmap &= self.facet_index.to_bitmap(~self.deleted)
+        return bitmap
+
+    def _allowed_mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        if not filters:
+            return None
+        if not isinstance(filters, dict):
+            raise ValueError("Filters must be an object mapping fields to values")
+        return self.facet_index.to_mask(self._filter_bitmap(filters))
+
+    @timed("lexical_search")
+    def _lexical_search(
+        self, processed_query_data: Dict[str, Any], allowed: np.ndarray = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if self.bm25_index is None:
+            return None
+
+        depth = max(BM25_CANDIDATES, RRF_DEPTH if RETRIEVAL_MODE == "hybrid" else 0)
+        if allowed is None:
+            return self.bm25_index.search(processed_query_data["keywords"], depth)
+
+        lexical_indices, lexical_scores = self.bm25_index.search(
+            processed_query_data["keywords"], self.bm25_index.n_docs
+        )
+        keep = allowed[lexical_indices]
+        return lexical_indices[keep][:depth], lexical_scores[keep][:depth]
+
+    def _prepare_query(self, query: str) -> Tuple[Dict[str, Any], str]:
+        logger.debug("Processing query: '%s'", query)
 
         processed_query_data = self.query_processor.process_query(query)
 
@@ -103,42 +686,272 @@ class InformationRetrievalSystem:
 
         final_query = enhanced_query if enhanced_query.strip() else query
 
-        print(
-            f"{Fore.YELLOW}Processed query: '{processed_query_data['processed_query']}'{Style.RESET_ALL}"
-        )
-        print(
-            f"{Fore.BLUE}Query type: {processed_query_data['query_type']}{Style.RESET_ALL}"
-        )
+        logger.debug("Processed query: '%s'", processed_query_data["processed_query"])
+        logger.debug("Query type: %s", processed_query_data["query_type"])
+
+        return processed_query_data, final_query
 
+    @timed("encode")
+    def _get_query_embeddings(self, final_queries: List[str]) -> np.ndarray:
         model_name = self.model._modules["0"].auto_model.config.name_or_path
-        cached_query_embedding = self.cache.get_embedding(final_query, model_name)
+        unique_queries = list(dict.fromkeys(final_queries))
+
+        with self.monitor.span("embedding_cache"):
+            embeddings = self.cache.batch_get_embeddings(unique_queries, model_name)
+        uncached_queries = [q for q in unique_queries if q not in embeddings]
+        trace_flag("embedding_cache_hits", len(unique_queries) - len(uncached_queries))
+        trace_flag("embedding_cache_misses", len(uncached_queries))
 
-        if cached_query_embedding is not None:
-            print(f"{Fore.GREEN}🚀 Query embedding found in cache!{Style.RESET_ALL}")
-            query_embedding = cached_query_embedding
+        if not uncached_queries:
+            logger.debug("Query embeddings found in cache! (%s)", len(unique_queries))
         else:
-            print(f"{Fore.YELLOW}🔄 Computing query embedding...{Style.RESET_ALL}")
-            query_embedding = self.model.encode([final_query], convert_to_numpy=True)[0]
-            self.cache.store_embedding(final_query, model_name, query_embedding)
-            print(f"{Fore.GREEN}💾 Query embedding saved to cache{Style.RESET_ALL}")
+            logger.debug(
+                "Computing %s/%s query embeddings...",
+                len(uncached_queries),
+                len(unique_queries),
+            )
+            with self.monitor.span("model_encode"):
+                new_embeddings = self.encoder.encode(uncached_queries)
+            embedding_pairs = list(zip(uncached_queries, new_embeddings))
+            self.cache.batch_store_embeddings(embedding_pairs, model_name)
+            embeddings.update(embedding_pairs)
+            logger.debug("Query embeddings saved to cache")
+
+        return np.array([embeddings[q] for q in final_queries], dtype=np.float32)
+
+    @timed("scoring")
+    def _score_queries(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        lexical_results: List[Tuple[np.ndarray, np.ndarray]] = None,
+        allowed: np.ndarray = None,
+        boosted: List[np.ndarray] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        if not BM25_CANDIDATES or lexical_results is None:
+            return self._score_documents(query_embeddings, top_k, allowed, boosted)
+
+        queries = normalize_rows(np.atleast_2d(query_embeddings))
+        results = [None] * len(queries)
+        dense_positions = []
+
+        for position, (lexical_indices, _) in enumerate(lexical_results):
+            if self.n_deleted:
+                lexical_indices = lexical_indices[~self.deleted[lexical_indices]]
+            if len(lexical_indices) < top_k:
+                dense_positions.append(position)
+                continue
+            candidate_indices = np.sort(lexical_indices[:BM25_CANDIDATES])
+            if self.passages is not None:
+                similarities = self.passages.score(
+                    queries[position], candidate_indices
+                )[0]
+            else:
+                similarities = (
+                    self.document_embeddings[candidate_indices] @ queries[position]
+                )
+            results[position] = (candidate_indices, similarities)
+
+        if dense_positions:
+            dense_results = self._score_documents(
+                queries[dense_positions],
+                top_k,
+                allowed,
+                None if boosted is None else [boosted[i] for i in dense_positions],
+            )
+            for position, result in zip(dense_positions, dense_results):
+                results[position] = result
+
+        return results
+
+    def _score_documents(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        allowed: np.ndarray = None,
+        boosted: List[np.ndarray] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        if self.passages is not None:
+            return self._score_passages(query_embeddings, top_k, allowed)
+        return self._score_dense(query_embeddings, top_k, allowed, boosted)
+
+    def _score_dense(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        allowed: np.ndarray = None,
+        boosted: List[np.ndarray] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        if allowed is not None:
+            allowed_indices = np.flatnonzero(allowed)
+            approximate = (
+                self.vector_index is not None or self.quantized_embeddings is not None
+            )
+            if not approximate or len(allowed_indices) <= FILTER_EXACT_MAX_DOCUMENTS:
+                return self._score_subset(query_embeddings, allowed_indices)
+
+            # Broad filters keep the approximate path, over-fetching by the
+            # inverse of the filter selectivity before masking.
+            top_k = int(np.ceil(top_k * len(allowed) / len(allowed_indices)))
+
+        if self.vector_index is not None:
+            results = self.vector_index.search(
+                query_embeddings, top_k * ANN_CANDIDATE_FACTOR
+            )
+            if boosted is None:
+                return results
+            queries = normalize_rows(np.atleast_2d(query_embeddings))
+            return [
+                include_rows(ids, scores, include, self.document_embeddings, query)
+                for (ids, scores), include, query in zip(results, boosted, queries)
+            ]
+
+        if self.quantized_embeddings is not None:
+            return self.quantized_embeddings.search(
+                query_embeddings,
+                self.document_embeddings,
+                max(RESCORE_CANDIDATES, top_k * ANN_CANDIDATE_FACTOR),
+                boosted,
+            )
+
+        # Exhaustive results must not depend on sharding: the cut covers the
+        # fusion depth plus every tombstoned row, and boosted documents are
+        # merged in whatever their raw score.
+        shards = self.shards
+        depth = self.n_deleted + max(
+            RRF_DEPTH if RETRIEVAL_MODE == "hybrid" else 0,
+            top_k * ANN_CANDIDATE_FACTOR,
+        )
+        if shards is not None and not shards.failed and depth < len(self.documents):
+            try:
+                return shards.search(
+                    query_embeddings, self.document_embeddings, depth, boosted
+                )
+            except (EOFError, OSError) as e:
+                # The scorer marks itself failed; it is only replaced under
+                # the write lock (_start_shards).
+                logger.warning("Scoring shards failed (%s), scoring in-process", e)
+
+        all_indices = np.arange(len(self.documents))
+        similarities = (
+            normalize_rows(np.atleast_2d(query_embeddings)) @ self.document_embeddings.T
+        )
 
-        similarities = self._calculate_similarities(query_embedding)
+        return [(all_indices, row) for row in similarities]
 
+    def _score_passages(
+        self, query_embeddings: np.ndarray, top_k: int, allowed: np.ndarray = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        if allowed is None:
+            candidate_indices = np.arange(len(self.documents))
+            similarities = self.passages.score(query_embeddings)
+        else:
+            candidate_indices = np.flatnonzero(allowed)
+            similarities = self.passages.score(query_embeddings, candidate_indices)
+
+        return [(candidate_indices, row) for row in similarities]
+
+    def _score_subset(
+        self,
+        query_embeddings: np.ndarray,
+        candidate_indices: np.ndarray,
+        block_size: int = 65536,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        queries = normalize_rows(np.atleast_2d(query_embeddings))
+        similarities = np.empty(
+            (len(queries), len(candidate_indices)), dtype=np.float32
+        )
+
+        for start in range(0, len(candidate_indices), block_size):
+            block = self.document_embeddings[
+                candidate_indices[start : start + block_size]
+            ]
+            similarities[:, start : start + len(block)] = queries @ block.T
+
+        return [(candidate_indices, row) for row in similarities]
+
+    def _rank_candidates(
+        self,
+        processed_query_data: Dict[str, Any],
+        candidate_indices: np.ndarray,
+        similarities: np.ndarray,
+        top_k: int,
+        lexical: Tuple[np.ndarray, np.ndarray] = None,
+        allowed: np.ndarray = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
         similarities = self._apply_query_processing_boost(
-            similarities, processed_query_data
+            similarities, processed_query_data, candidate_indices
         )
+        similarities = self._mask_excluded(similarities, candidate_indices, allowed)
 
-        ranked_indices = np.argsort(similarities)[::-1]
+        if RETRIEVAL_MODE == "hybrid" and lexical is not None:
+            candidate_indices, similarities = self._fuse_rankings(
+                candidate_indices, similarities, lexical[0]
+            )
 
-        results = []
-        for i in ranked_indices[:top_k]:
-            results.append((self.documents[i], float(similarities[i])))
+        best = top_k_indices(similarities, top_k)
+        best = best[similarities[best] > -np.inf]
 
-        return results
+        return (
+            np.asarray(candidate_indices[best], dtype=np.int64),
+            np.asarray(similarities[best], dtype=np.float32),
+        )
+
+    @timed("fusion")
+    def _fuse_rankings(
+        self,
+        candidate_indices: np.ndarray,
+        similarities: np.ndarray,
+        lexical_indices: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        dense_order = top_k_indices(similarities, RRF_DEPTH)
+        dense_order = dense_order[similarities[dense_order] > -np.inf]
+        dense_indices = candidate_indices[dense_order]
+
+        lexical_indices = lexical_indices[:RRF_DEPTH]
+        if self.n_deleted:
+            lexical_indices = lexical_indices[~self.deleted[lexical_indices]]
+
+        ranked = np.concatenate((dense_indices, lexical_indices))
+        ranks = np.concatenate(
+            (np.arange(len(dense_indices)), np.arange(len(lexical_indices)))
+        )
+
+        fused_indices, positions = np.unique(ranked, return_inverse=True)
+        # Scaled so a document ranked first by both retrievers scores 1.0.
+        fused_scores = np.bincount(
+            positions, weights=(RRF_K + 1) / (2.0 * (RRF_K + 1 + ranks))
+        )
+
+        return fused_indices, fused_scores
+
+    def _mask_excluded(
+        self,
+        similarities: np.ndarray,
+        candidate_indices: np.ndarray,
+        allowed: np.ndarray = None,
+    ) -> np.ndarray:
+        if allowed is not None:
+            return np.where(allowed[candidate_indices], similarities, -np.inf)
+        if not self.n_deleted:
+            return similarities
+        return np.where(self.deleted[candidate_indices], -np.inf, similarities)
 
+    @read_locked
     def retrieve_similar_documents(
         self, doc_index: int, top_k: int = 10
     ) -> List[Tuple[Dict[str, Any], float]]:
+        indices, scores = self.rank_similar_documents(doc_index, top_k)
+        return [
+            (self.documents[i], float(score))
+            for i, score in zip(indices.tolist(), scores.tolist())
+        ]
+
+    @read_locked
+    @timed("similar")
+    def rank_similar_documents(
+        self, doc_index: int, top_k: int = 10
+    ) -> Tuple[np.ndarray, np.ndarray]:
         if not self.documents or self.document_embeddings is None:
             raise ValueError("Collection not loaded")
 
@@ -147,64 +960,97 @@ class InformationRetrievalSystem:
                 f"Document index {doc_index} out of range (0-{len(self.documents)-1})"
             )
 
-        print(
-            f"{Fore.CYAN}Finding documents similar to document #{doc_index}{Style.RESET_ALL}"
-        )
-        print(
-            f"{Fore.YELLOW}Title: {self.documents[doc_index]['title']}{Style.RESET_ALL}"
-        )
+        if self.deleted[doc_index]:
+            raise ValueError(f"Document #{doc_index} has been removed")
+
+        logger.debug("Finding documents similar to document #%s", doc_index)
+        logger.debug("Title: %s", self.documents[doc_index]["title"])
+
+        graph = self.similarity_graph
+        if graph is not None and top_k <= graph.k and doc_index < graph.n_rows:
+            neighbours, scores = graph.neighbours_of(doc_index, graph.k)
+            live = ~self.deleted[neighbours]
+            if live.sum() >= top_k:
+                return (
+                    neighbours[live][:top_k].astype(np.int64),
+                    scores[live][:top_k].astype(np.float32),
+                )
 
         doc_embedding = self.document_embeddings[doc_index]
-        similarities = self._calculate_similarities(doc_embedding)
-        similarities[doc_index] = -1
-        ranked_indices = np.argsort(similarities)[::-1]
 
-        results = []
-        for i in ranked_indices[:top_k]:
-            results.append((self.documents[i], float(similarities[i])))
+        if (
+            self.vector_index is not None
+            or self.quantized_embeddings is not None
+            or (self.shards is not None and not self.shards.failed)
+        ):
+            candidate_indices, similarities = self._score_dense(
+                doc_embedding, top_k + 1
+            )[0]
+            keep = candidate_indices != doc_index
+            candidate_indices = candidate_indices[keep]
+            similarities = self._mask_excluded(similarities[keep], candidate_indices)
+        else:
+            candidate_indices = np.arange(len(self.documents))
+            similarities = self._calculate_similarities(doc_embedding)
+            similarities[doc_index] = -np.inf
+            similarities = self._mask_excluded(similarities, candidate_indices)
 
-        return results
+        best = top_k_indices(similarities, top_k)
+        best = best[similarities[best] > -np.inf]
 
-    def _calculate_similarities(self, query_embedding: np.ndarray) -> np.ndarray:
-        similarities = np.dot(self.document_embeddings, query_embedding) / (
-            np.linalg.norm(self.document_embeddings, axis=1)
-            * np.linalg.norm(query_embedding)
+        return (
+            np.asarray(candidate_indices[best], dtype=np.int64),
+            np.asarray(similarities[best], dtype=np.float32),
         )
 
-        return similarities
+    def _calculate_similarities(self, query_embedding: np.ndarray) -> np.ndarray:
+        return self.document_embeddings @ normalize_rows(query_embedding)
 
+    @timed("boosting")
     def _apply_query_processing_boost(
-        self, similarities: np.ndarray, processed_query_data: Dict[str, Any]
+        self,
+        similarities: np.ndarray,
+        processed_query_data: Dict[str, Any],
+        candidate_indices: np.ndarray,
     ) -> np.ndarray:
 
         query_keywords = processed_query_data["keywords"]
 
-        if not query_keywords:
+        if not query_keywords or not len(candidate_indices):
             return similarities
 
-        boosted_similarities = similarities.copy()
-
-        for i, doc in enumerate(self.documents):
-            boost_factor = 1.0
-
-            doc_keywords = [kw.lower().strip() for kw in doc.get("keywords", [])]
-            keyword_matches = sum(
-                1 for token in query_keywords if token in doc_keywords
-            )
-            if keyword_matches > 0:
-                boost_factor += 0.1 * keyword_matches
+        matched_docs, boost_factors = self.boost_index.boost_factors(query_keywords)
 
-            doc_title = doc.get("title", "").lower()
-            title_matches = sum(1 for token in query_keywords if token in doc_title)
-            if title_matches > 0:
-                boost_factor += 0.15 * title_matches
+        if len(candidate_indices) == len(self.documents) and np.array_equal(
+            candidate_indices, np.arange(len(self.documents))
+        ):
+            positions = matched_docs
+        else:
+            order = np.argsort(candidate_indices)
+            sorted_candidates = candidate_indices[order]
+            found = np.searchsorted(sorted_candidates, matched_docs)
+            found[found == len(sorted_candidates)] = 0
+            in_candidates = sorted_candidates[found] == matched_docs
+            positions = order[found[in_candidates]]
+            boost_factors = boost_factors[in_candidates]
 
-            boost_factor = min(boost_factor, 1.5)
-            boosted_similarities[i] *= boost_factor
+        boosted_similarities = similarities.copy()
+        boosted_similarities[positions] *= boost_factors.astype(similarities.dtype)
 
         return boosted_similarities
 
     def search_and_display(self, query: str, top_k: int = 5) -> None:
+        from colorama import Fore, Style
+
+        processed_query_data = self.query_processor.process_query(query)
+        print(f"{Fore.CYAN}Processing query: '{query}'{Style.RESET_ALL}")
+        print(
+            f"{Fore.YELLOW}Processed query: '{processed_query_data['processed_query']}'{Style.RESET_ALL}"
+        )
+        print(
+            f"{Fore.BLUE}Query type: {processed_query_data['query_type']}{Style.RESET_ALL}"
+        )
+
         results = self.retrieve(query, top_k)
 
         print(f"\n{'='*80}")
@@ -230,6 +1076,8 @@ class InformationRetrievalSystem:
 
     def display_document(self, doc_index: int) -> None:
         """Display the full details of a document"""
+        from colorama import Fore, Style
+
         if doc_index < 0 or doc_index >= len(self.documents):
             print(f"{Fore.RED}Invalid document index: {doc_index}{Style.RESET_ALL}")
             return
@@ -262,6 +1110,8 @@ class InformationRetrievalSystem:
     def find_and_display_similar_documents(
         self, doc_index: int, top_k: int = 5
     ) -> None:
+        from colorama import Fore, Style
+
         try:
             self.display_document(doc_index)
 
@@ -298,26 +1148,30 @@ class InformationRetrievalSystem:
             print(f"{Fore.RED}Error: {e}{Style.RESET_ALL}")
 
     def get_cache_stats(self) -> Dict[str, Any]:
-        return self.cache.get_cache_stats()
+        cache_stats = self.cache.get_cache_stats()
+        cache_stats["result_cache"] = self.result_cache.stats()
+        cache_stats["query_processor"] = self.query_processor.stats()
+        cache_stats["encode_batching"] = self.encoder.stats()
+        return cache_stats
 
     def clear_cache(self) -> None:
         self.cache.clear_cache()
-        print(f"{Fore.GREEN}Cache cleared!{Style.RESET_ALL}")
+        self.result_cache.clear()
+        logger.info("Cache cleared")
 
+    @read_locked
     def get_document_by_id(self, doc_id: str) -> Dict[str, Any]:
-        for doc in self.documents:
-            if doc.get("id") == doc_id:
-                return doc
-        return None
+        doc_index = self.get_document_index(doc_id)
+        return self.documents[doc_index] if doc_index != -1 else None
 
+    @read_locked
     def get_document_index(self, doc_id: str) -> int:
-        for idx, doc in enumerate(self.documents):
-            if doc.get("id") == doc_id:
-                return idx
-        return -1
+        return self.id_to_index.get(doc_id, -1)
 
 
 def main():
+    from colorama import Fore, Style
+
     ir_system = InformationRetrievalSystem()
 
     ir_system.load_collection()
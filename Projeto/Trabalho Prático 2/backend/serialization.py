@@ -0,0 +1,111 @@
+import json
+from typing import List, Dict, Any
+import numpy as np
+from vector_index import append_rows
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def truncate_text(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "..."
+
+
+class DocumentFragments:
+    """Pre-serialized JSON object of every document, built once per document.
+
+    spans[d, f] holds the byte range of the `"field":value` member of field f
+    inside fragment d (0, 0 when absent), so projections and truncated
+    abstracts are assembled by slicing and concatenating bytes.
+    """
+
+    def __init__(self):
+        self.fragments = []
+        self.field_ids = {}
+        self.spans = np.zeros((0, 0, 2), dtype=np.int32)
+        self._spans_buffer = self.spans
+
+    def build(self, documents: List[Dict[str, Any]]) -> None:
+        self.fragments = []
+        self.field_ids = {}
+        self.spans = np.zeros((0, 0, 2), dtype=np.int32)
+        self._spans_buffer = self.spans
+        self.add_documents(documents)
+
+    def add_documents(self, documents: List[Dict[str, Any]]) -> None:
+        document_spans = []
+        for doc in documents:
+            members, spans = [], {}
+            position = 1
+            for field, value in doc.items():
+                member = dumps(field) + b":" + dumps(value)
+                field_id = self.field_ids.setdefault(field, len(self.field_ids))
+                spans[field_id] = (position, position + len(member))
+                members.append(member)
+                position += len(member) + 1
+            self.fragments.append(b"{" + b",".join(members) + b"}")
+            document_spans.append(spans)
+
+        n_fields = len(self.field_ids)
+        if n_fields > self._spans_buffer.shape[1]:
+            self._spans_buffer = np.pad(
+                self._spans_buffer[: len(self.spans)],
+                ((0, 0), (0, n_fields - self._spans_buffer.shape[1]), (0, 0)),
+            )
+
+        new_spans = np.zeros((len(documents), n_fields, 2), dtype=np.int32)
+        for row, spans in enumerate(document_spans):
+            for field_id, span in spans.items():
+                new_spans[row, field_id] = span
+
+        n_rows = len(self.spans)
+        self._spans_buffer = append_rows(self._spans_buffer, n_rows, new_spans)
+        self.spans = self._spans_buffer[: n_rows + len(documents)]
+
+    def fragment(
+        self, doc_index: int, fields: List[str] = None, abstract_chars: int = None
+    ) -> bytes:
+        fragment = self.fragments[doc_index]
+        if fields is None and abstract_chars is None:
+            return fragment
+
+        spans = self.spans[doc_index]
+        if fields is None:
+            field_ids = np.flatnonzero(spans[:, 1])
+        else:
+            field_ids = [
+                self.field_ids[field]
+                for field in dict.fromkeys(["id"] + list(fields))
+                if field in self.field_ids
+            ]
+            field_ids = [f for f in field_ids if spans[f, 1]]
+
+        abstract_id = self.field_ids.get("abstract")
+        members = []
+        for field_id in sorted(field_ids, key=lambda f: spans[f, 0]):
+            start, end = spans[field_id]
+            if field_id == abstract_id and abstract_chars is not None:
+                abstract = loads(fragment[start + len(b'"abstract":') : end])
+                members.append(
+                    b'"abstract":' + dumps(truncate_text(abstract, abstract_chars))
+                )
+            else:
+                members.append(fragment[start:end])
+
+        return b"{" + b",".join(members) + b"}"
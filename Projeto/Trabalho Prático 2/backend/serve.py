@@ -0,0 +1,112 @@
+import os
+import signal
+import socket
+import sys
+from config import SERVE_HOST, SERVE_PORT, SERVE_THREADS, SERVE_WORKERS
+from utils import configure_logging
+from colorama import Fore, Style, init
+
+init(autoreset=True)
+
+
+def serve_waitress(app, host: str, port: int, threads: int, sock=None) -> bool:
+    try:
+        from waitress import serve
+    except ImportError:
+        return False
+
+    print(
+        f"{Fore.GREEN}Serving with waitress on http://{host}:{port} ({threads} threads){Style.RESET_ALL}"
+    )
+    if sock is not None:
+        serve(app, sockets=[sock], threads=threads)
+    else:
+        serve(app, host=host, port=port, threads=threads)
+    return True
+
+
+def serve_werkzeug(app, host: str, port: int, sock=None) -> None:
+    from werkzeug.serving import make_server
+
+    print(
+        f"{Fore.YELLOW}waitress not installed, using the threaded werkzeug server on http://{host}:{port}{Style.RESET_ALL}"
+    )
+    fd = sock.fileno() if sock is not None else None
+    make_server(host, port, app, threaded=True, fd=fd).serve_forever()
+
+
+def serve(app, host: str, port: int, threads: int, sock=None) -> None:
+    if not serve_waitress(app, host, port, threads, sock):
+        serve_werkzeug(app, host, port, sock)
+
+
+def serve_prefork(
+    app, host: str, port: int, threads: int, workers: int, after_fork=None
+) -> None:
+    # The system is already loaded, so forked workers share the model and the
+    # memory-mapped matrices copy-on-write and all accept on one socket.
+    # Each worker has its own copy of the collection, so admin writes are
+    # refused (see app.admin_documents).
+    app.config["IRUM_WORKERS"] = workers
+    sock = socket.create_server((host, port), backlog=2048)
+    sock.set_inheritable(True)
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                if after_fork is not None:
+                    after_fork()
+                serve(app, host, port, threads, sock)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    print(
+        f"{Fore.GREEN}Forked {workers} workers sharing http://{host}:{port}{Style.RESET_ALL}"
+    )
+    print(
+        f"{Fore.YELLOW}Admin document writes are disabled with more than one worker{Style.RESET_ALL}"
+    )
+
+    def stop(signum=None, frame=None):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        stop()
+
+
+def main():
+    host = os.environ.get("IRUM_HOST", SERVE_HOST)
+    port = int(os.environ.get("IRUM_PORT", SERVE_PORT))
+    threads = int(os.environ.get("IRUM_THREADS", SERVE_THREADS))
+    workers = int(os.environ.get("IRUM_WORKERS", SERVE_WORKERS))
+
+    configure_logging()
+
+    from app import app, load_system
+
+    prefork = workers > 1 and hasattr(os, "fork")
+
+    # torch's thread pool does not survive fork: with workers, the master
+    # warms up everything but the model and each worker encodes after fork.
+    ir_system = load_system(encode=not prefork)
+
+    if prefork:
+        serve_prefork(app, host, port, threads, workers, ir_system.warmup)
+    else:
+        serve(app, host, port, threads)
+
+
+if __name__ == "__main__":
+    main()
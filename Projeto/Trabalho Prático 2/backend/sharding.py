@@ -0,0 +1,196 @@
+import logging
+import os
+import queue
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from typing import List, Tuple
+import numpy as np
+from vector_index import include_rows, normalize_rows, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+
+def _top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    if k >= scores.shape[1]:
+        return np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def _shard_worker(connections, store_path: str, start: int, end: int) -> None:
+    matrix = np.load(store_path, mmap_mode="r")[start:end]
+
+    # One connection per channel; whichever channels have a query are served.
+    open_connections = list(connections)
+    while open_connections:
+        for connection in wait(open_connections):
+            try:
+                message = connection.recv()
+            except EOFError:
+                message = None
+            if message is None:
+                connection.close()
+                open_connections.remove(connection)
+                continue
+
+            queries, k = message
+            scores = queries @ matrix.T
+            best = _top_k_rows(scores, k)
+            connection.send(
+                (
+                    start + best,
+                    np.take_along_axis(scores, best, axis=1).astype(np.float32),
+                )
+            )
+
+
+class ShardedScorer:
+    """Exhaustive scoring split across worker processes by row range.
+
+    Every worker memory-maps its own row range of the stored .npy matrix, so
+    the shards share the OS page cache instead of copying the matrix. Each
+    worker returns its local top-k and the coordinator merges them, adding
+    the `include` rows of each query (scored exactly) so callers can keep
+    documents that re-ranking may lift above the cut.
+
+    Every worker serves `n_channels` pipes. A search checks out one channel
+    for its round-trip, so up to `n_channels` queries are in flight at once
+    and further callers wait for a free channel. A broken pipe marks the
+    scorer as failed, and every later search raises OSError for the caller
+    to fall back.
+    """
+
+    def __init__(self, store_path: str, n_rows: int, n_shards: int, n_channels: int):
+        self.store_path = store_path
+        self.n_rows = n_rows
+        self.n_shards = min(n_shards, n_rows)
+        self.n_channels = max(1, n_channels)
+        self._channels = []
+        self._free_channels = queue.Queue()
+        self._processes = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.failed = False
+
+    def start(self) -> None:
+        self._pid = os.getpid()
+        context = multiprocessing.get_context("fork")
+        bounds = np.linspace(0, self.n_rows, self.n_shards + 1).astype(np.int64)
+
+        self._channels = [[] for _ in range(self.n_channels)]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            pipes = [context.Pipe() for _ in range(self.n_channels)]
+            process = context.Process(
+                target=_shard_worker,
+                args=(
+                    [child for _, child in pipes],
+                    self.store_path,
+                    int(start),
+                    int(end),
+                ),
+                daemon=True,
+            )
+            process.start()
+            for channel, (parent_connection, child_connection) in zip(
+                self._channels, pipes
+            ):
+                child_connection.close()
+                channel.append(parent_connection)
+            self._processes.append(process)
+
+        for channel in range(self.n_channels):
+            self._free_channels.put(channel)
+
+        logger.info(
+            "Started %s scoring shards over %s documents (%s channels)",
+            self.n_shards,
+            self.n_rows,
+            self.n_channels,
+        )
+
+    def _check_usable(self) -> None:
+        with self._lock:
+            if self.failed:
+                raise OSError("Scoring shards have failed")
+            if os.getpid() != self._pid:
+                # The pipes belong to the process that started the shards.
+                self.failed = True
+                raise OSError("Scoring shards were started by another process")
+
+    def search(
+        self,
+        query_embeddings: np.ndarray,
+        full_matrix: np.ndarray,
+        k: int,
+        include: List[np.ndarray] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        queries = normalize_rows(np.atleast_2d(query_embeddings))
+
+        self._check_usable()
+        channel = self._free_channels.get()
+        try:
+            # The shards may have failed while this caller waited for a channel.
+            self._check_usable()
+            connections = self._channels[channel]
+            for connection in connections:
+                connection.send((queries, k))
+            shard_results = [connection.recv() for connection in connections]
+        except (EOFError, OSError):
+            with self._lock:
+                self.failed = True
+            raise
+        finally:
+            self._free_channels.put(channel)
+
+        candidate_ids = [ids for ids, _ in shard_results]
+        candidate_scores = [scores for _, scores in shard_results]
+
+        # Rows added after the shards were started are scored here.
+        if len(full_matrix) > self.n_rows:
+            tail_scores = queries @ full_matrix[self.n_rows :].T
+            tail_best = _top_k_rows(tail_scores, k)
+            candidate_ids.append(self.n_rows + tail_best)
+            candidate_scores.append(np.take_along_axis(tail_scores, tail_best, axis=1))
+
+        candidate_ids = np.concatenate(candidate_ids, axis=1)
+        candidate_scores = np.concatenate(candidate_scores, axis=1)
+
+        results = []
+        for position, (ids, scores) in enumerate(zip(candidate_ids, candidate_scores)):
+            best = top_k_indices(scores, k)
+            ids, scores = ids[best].astype(np.int64), scores[best]
+
+            if include is not None:
+                ids, scores = include_rows(
+                    ids, scores, include[position], full_matrix, queries[position]
+                )
+
+            results.append((ids, scores))
+
+        return results
+
+    def close(self) -> None:
+        if os.getpid() != self._pid:
+            self._channels = []
+            self._processes = []
+            return
+
+        with self._lock:
+            self.failed = True
+
+        # Channels are closed as they come back, never under a running search.
+        for _ in range(len(self._channels)):
+            for connection in self._channels[self._free_channels.get()]:
+                try:
+                    connection.send(None)
+                    connection.close()
+                except (OSError, EOFError):
+                    pass
+
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+        self._channels = []
+        self._processes = []
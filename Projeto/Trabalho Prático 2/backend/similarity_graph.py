@@ -0,0 +1,128 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+import numpy as np
+from config import SIMILARITY_GRAPH_K, SIMILARITY_GRAPH_BLOCK_ROWS
+from vector_index import embeddings_fingerprint, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+
+class SimilarityGraph:
+    """Top-K nearest neighbours of every document, computed offline.
+
+    Rows are scored in blocks of `block_rows` against the whole matrix and
+    the blocks run on a thread pool (the matmul and argpartition release the
+    GIL). Neighbours are stored as int32 and scores as float16, sorted by
+    decreasing similarity, so a lookup is a slice of one row.
+    """
+
+    def __init__(
+        self,
+        k: int = SIMILARITY_GRAPH_K,
+        block_rows: int = SIMILARITY_GRAPH_BLOCK_ROWS,
+        block_columns: int = 65536,
+    ):
+        self.k = k
+        self.block_rows = block_rows
+        self.block_columns = block_columns
+        self.neighbours = None
+        self.scores = None
+        self.fingerprint = None
+
+    def build(
+        self, embeddings: np.ndarray, n_workers: int = 0, fingerprint: str = None
+    ) -> None:
+        matrix = normalize_rows(embeddings)
+        n_rows = len(matrix)
+        k = min(self.k, n_rows - 1)
+
+        self.neighbours = np.zeros((n_rows, k), dtype=np.int32)
+        self.scores = np.zeros((n_rows, k), dtype=np.float16)
+
+        starts = range(0, n_rows, self.block_rows)
+        n_workers = n_workers or os.cpu_count() or 1
+
+        logger.info(
+            "Building similarity graph (k=%s) over %s documents with %s workers...",
+            k,
+            n_rows,
+            n_workers,
+        )
+
+        if k > 0:
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                list(
+                    pool.map(lambda start: self._build_block(matrix, start, k), starts)
+                )
+
+        self.k = k
+        self.fingerprint = fingerprint or embeddings_fingerprint(embeddings)
+
+    def _build_block(self, matrix: np.ndarray, start: int, k: int) -> None:
+        end = min(start + self.block_rows, len(matrix))
+        rows = np.arange(start, end)
+        best_ids = np.zeros((len(rows), 0), dtype=np.int64)
+        best_scores = np.zeros((len(rows), 0), dtype=np.float32)
+
+        # Columns are scored in chunks and merged into a running top-k, so a
+        # block never holds more than block_rows x block_columns scores.
+        for column_start in range(0, len(matrix), self.block_columns):
+            column_end = min(column_start + self.block_columns, len(matrix))
+            scores = matrix[start:end] @ matrix[column_start:column_end].T
+
+            own = (rows >= column_start) & (rows < column_end)
+            scores[own.nonzero()[0], rows[own] - column_start] = -np.inf
+
+            ids = np.broadcast_to(np.arange(column_start, column_end), scores.shape)
+            best_ids = np.concatenate([best_ids, ids], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+
+            if best_scores.shape[1] > k:
+                top = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_ids = np.take_along_axis(best_ids, top, axis=1)
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        self.neighbours[start:end] = np.take_along_axis(best_ids, order, axis=1)
+        self.scores[start:end] = np.take_along_axis(best_scores, order, axis=1)
+
+    def neighbours_of(
+        self, doc_index: int, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        return self.neighbours[doc_index, :top_k], self.scores[doc_index, :top_k]
+
+    @property
+    def n_rows(self) -> int:
+        return 0 if self.neighbours is None else len(self.neighbours)
+
+    def save(self, filepath: str) -> None:
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        np.savez(
+            filepath,
+            neighbours=self.neighbours,
+            scores=self.scores,
+            fingerprint=np.array(self.fingerprint),
+        )
+
+    def load(
+        self, filepath: str, embeddings: np.ndarray, fingerprint: str = None
+    ) -> bool:
+        if not os.path.exists(filepath):
+            return False
+
+        try:
+            data = np.load(filepath)
+            saved_fingerprint = str(data["fingerprint"])
+        except Exception:
+            return False
+
+        if saved_fingerprint != (fingerprint or embeddings_fingerprint(embeddings)):
+            return False
+
+        self.neighbours = data["neighbours"]
+        self.scores = data["scores"]
+        self.k = self.neighbours.shape[1]
+        self.fingerprint = saved_fingerprint
+        return True
@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any
+from config import TRACE_ENABLED, TRACE_BUFFER_SIZE, TRACE_SLOW_MS, TRACE_SLOW_LOG
+
+current_trace = ContextVar("current_trace", default=None)
+
+
+class RequestTrace:
+    def __init__(self, name: str, info: Dict[str, Any] = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.info = dict(info or {})
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.total = None
+        self.stages = {}
+        self.flags = {}
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        total, count = self.stages.get(stage, (0.0, 0))
+        self.stages[stage] = (total + seconds, count + 1)
+
+    def finish(self) -> None:
+        self.total = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.started,
+            "total_ms": round((self.total or 0.0) * 1000, 3),
+            "stages": {
+                stage: {"ms": round(seconds * 1000, 3), "calls": count}
+                for stage, (seconds, count) in self.stages.items()
+            },
+            "flags": self.flags,
+            "info": self.info,
+        }
+
+    def server_timing(self) -> str:
+        # Server-Timing header, shown per request in the browser dev tools.
+        entries = [
+            f"{stage};dur={seconds * 1000:.3f}"
+            for stage, (seconds, _) in self.stages.items()
+        ]
+        entries.extend(f'{flag};desc="{value}"' for flag, value in self.flags.items())
+        if self.total is not None:
+            entries.append(f"total;dur={self.total * 1000:.3f}")
+        return ", ".join(entries)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+
+def trace_flag(flag: str, value: Any) -> None:
+    trace = current_trace.get()
+    if trace is not None:
+        trace.flags[flag] = value
+
+
+class RequestTracer:
+    """Optional per-request stage tracing.
+
+    A trace lives in a context variable for the duration of a request;
+    PerformanceMonitor spans add their timings to it and code along the way
+    can set flags (cache hit/miss). Finished traces go to a ring buffer and
+    the ones slower than `slow_ms` are appended to a JSONL log.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = TRACE_ENABLED,
+        buffer_size: int = TRACE_BUFFER_SIZE,
+        slow_ms: float = TRACE_SLOW_MS,
+        slow_log: str = TRACE_SLOW_LOG,
+    ):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.slow_log = slow_log
+        self.traces = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+
+    def start(self, name: str, info: Dict[str, Any] = None, force: bool = False):
+        if current_trace.get() is not None or not (self.enabled or force):
+            return None, None
+
+        trace = RequestTrace(name, info)
+        return trace, current_trace.set(trace)
+
+    def finish(self, trace: RequestTrace, token) -> None:
+        if trace is None:
+            return
+
+        current_trace.reset(token)
+        trace.finish()
+        record = trace.to_dict()
+
+        with self._lock:
+            self.traces.append(record)
+            if self.slow_log and record["total_ms"] >= self.slow_ms:
+                os.makedirs(os.path.dirname(self.slow_log) or ".", exist_ok=True)
+                with open(self.slow_log, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    @contextmanager
+    def trace(self, name: str, info: Dict[str, Any] = None, force: bool = False):
+        trace, token = self.start(name, info, force)
+        try:
+            yield trace
+        finally:
+            self.finish(trace, token)
+
+    def recent(self, limit: int = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            traces = list(self.traces)
+        return traces[-limit:] if limit else traces
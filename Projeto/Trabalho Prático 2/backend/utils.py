@@ -1,24 +1,77 @@
 import os
 import json
+import logging
 import re
+import threading
 import unicodedata
+from functools import lru_cache
 from typing import List, Dict, Any
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from colorama import Fore, Style, init
+from config import LOG_LEVEL, LOG_FORMAT
 
-init(autoreset=True)
+logger = logging.getLogger(__name__)
 
-try:
-    nltk.data.find("tokenizers/punkt")
-except LookupError:
-    nltk.download("punkt")
+NLTK_RESOURCES = (("tokenizers/punkt", "punkt"), ("corpora/stopwords", "stopwords"))
 
-try:
-    nltk.data.find("corpora/stopwords")
-except LookupError:
-    nltk.download("stopwords")
+_nltk_ready = False
+_nltk_lock = threading.Lock()
+
+
+def ensure_nltk_data() -> None:
+    # Checked (and downloaded if missing) on first use or at warmup, never at import.
+    global _nltk_ready
+    if _nltk_ready:
+        return
+
+    with _nltk_lock:
+        if _nltk_ready:
+            return
+
+        import nltk
+
+        for resource, package in NLTK_RESOURCES:
+            try:
+                nltk.data.find(resource)
+            except LookupError:
+                logger.info("Downloading NLTK data: %s", package)
+                nltk.download(package, quiet=True)
+
+        _nltk_ready = True
+
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(
+    level: str = None, log_format: str = LOG_FORMAT, formatter=None
+) -> None:
+    level = level or os.environ.get("IRUM_LOG_LEVEL", LOG_LEVEL)
+
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    if root.handlers and formatter is None:
+        return
+
+    if formatter is None:
+        if log_format == "json":
+            formatter = JsonLogFormatter()
+        else:
+            formatter = logging.Formatter(
+                "%(asctime)s %(levelname)s %(name)s: %(message)s"
+            )
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(formatter)
+    root.handlers = [handler]
 
 
 def ensure_dir(directory: str) -> None:
@@ -37,29 +90,69 @@ def load_json(filepath: str) -> Any:
         return json.load(f)
 
 
+# Approximates nltk's word_tokenize once filtered by extract_keywords: tokens
+# keep inner hyphens, dots, slashes and apostrophes (and are then dropped as
+# non-alphabetic), English clitics ('s, n't, ...) split off, and so do the
+# contractions word_tokenize splits (cannot, gonna, wanna, gimme, lemme,
+# gotta, more'n). It matches word_tokenize on the collection and on these
+# cases, but other punctuation corner cases can still yield other keywords.
+_SPLIT_CONTRACTION = (
+    r"(?:can(?=not\b)|gim(?=me\b)|gon(?=na\b)|got(?=ta\b)"
+    r"|lem(?=me\b)|wan(?=na\b)|more(?='n\b))"
+)
+KEYWORD_TOKEN_PATTERN = re.compile(
+    rf"(?<!\w){_SPLIT_CONTRACTION}"
+    r"|\w+?(?=n't\b)"
+    rf"|\w+(?:[-./](?!{_SPLIT_CONTRACTION})\w+|'(?!(?:s|m|d|ll|re|ve)\b)\w+)*"
+    rf"(?:-(?={_SPLIT_CONTRACTION}))?"
+)
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=65536)
+def is_control_char(char: str) -> bool:
+    return unicodedata.category(char)[0] == "C"
+
+
 def clean_text(text: str) -> str:
     if not text:
         return ""
 
-    text = "".join(char for char in text if unicodedata.category(char)[0] != "C")
+    # Each distinct character is classified once (and cached), and the text
+    # is only rewritten, with a single translate, when it has control chars.
+    controls = {ord(char): None for char in set(text) if is_control_char(char)}
+    if controls:
+        text = text.translate(controls)
 
-    text = re.sub(r"\s+", " ", text)
+    text = _WHITESPACE_PATTERN.sub(" ", text)
 
     text = text.strip()
 
     return text
 
 
+@lru_cache(maxsize=None)
+def get_stopwords(language: str = "portuguese") -> frozenset:
+    ensure_nltk_data()
+    from nltk.corpus import stopwords
+
+    try:
+        return frozenset(stopwords.words(language))
+    except:
+        return frozenset(stopwords.words("english"))
+
+
 def extract_keywords(text: str, language: str = "portuguese") -> List[str]:
     if not text:
         return []
 
+    ensure_nltk_data()
+    from nltk.tokenize import word_tokenize
+
     tokens = word_tokenize(text.lower())
 
-    try:
-        stop_words = set(stopwords.words(language))
-    except:
-        stop_words = set(stopwords.words("english"))
+    stop_words = get_stopwords(language)
 
     keywords = [
         token
@@ -84,6 +177,3 @@ def calculate_jaccard_similarity(set1: set, set2: set) -> float:
 
 def normalize_score(score: float, min_val: float = 0.0, max_val: float = 1.0) -> float:
     return max(min_val, min(max_val, score))
-
-
-print(f"{Fore.GREEN}Utils module loaded successfully!{Style.RESET_ALL}")
@@ -0,0 +1,243 @@
+import logging
+import os
+import hashlib
+from typing import List, Tuple
+import numpy as np
+from config import IVF_N_LISTS, IVF_N_PROBE, IVF_TRAIN_ITERATIONS
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def append_rows(buffer: np.ndarray, n_rows: int, rows: np.ndarray) -> np.ndarray:
+    """Writes `rows` after the first `n_rows` of `buffer`, growing it geometrically.
+
+    Read-only buffers (memory-mapped stores) are copied into memory first.
+    """
+    needed = n_rows + len(rows)
+    if buffer is None or needed > len(buffer) or not buffer.flags.writeable:
+        capacity = max(needed, n_rows + n_rows // 2 + 16)
+        grown = np.empty((capacity,) + rows.shape[1:], dtype=rows.dtype)
+        if n_rows:
+            grown[:n_rows] = buffer[:n_rows]
+        buffer = grown
+    buffer[n_rows:needed] = rows
+    return buffer
+
+
+def include_rows(
+    ids: np.ndarray,
+    scores: np.ndarray,
+    include: np.ndarray,
+    matrix: np.ndarray,
+    query: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Adds the `include` rows missing from a candidate list, scored exactly.
+
+    Approximate candidate generators use it for documents that re-ranking
+    (the keyword/title boost) may lift above their cut. `matrix` rows and
+    `query` are normalized.
+    """
+    if include is None or not len(include):
+        return ids, scores
+
+    extra = np.setdiff1d(include, ids)
+    if not len(extra):
+        return ids, scores
+
+    return (
+        np.concatenate((ids, extra)).astype(np.int64),
+        np.concatenate((scores, matrix[extra] @ query)).astype(np.float32),
+    )
+
+
+def embeddings_fingerprint(embeddings: np.ndarray) -> str:
+    data = np.ascontiguousarray(embeddings, dtype=np.float32)
+    return f"{data.shape[0]}x{data.shape[1]}:{hashlib.md5(data.tobytes()).hexdigest()}"
+
+
+class IVFIndex:
+    """Inverted-file index: k-means coarse quantizer with one posting list per centroid.
+
+    `n_probe` is the recall/latency knob: more probed lists means more candidates
+    scored per query.
+    """
+
+    def __init__(
+        self,
+        n_lists: int = IVF_N_LISTS,
+        n_probe: int = IVF_N_PROBE,
+        train_iterations: int = IVF_TRAIN_ITERATIONS,
+    ):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_iterations = train_iterations
+        self.centroids = None
+        self.list_offsets = None
+        self.list_ids = None
+        self.list_vectors = None
+        self.extra_ids = np.empty(0, dtype=np.int64)
+        self.extra_vectors = None
+        self.fingerprint = None
+
+    def build(self, embeddings: np.ndarray, fingerprint: str = None) -> None:
+        vectors = normalize_rows(embeddings)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+
+        logger.info(
+            "Building IVF index with %s lists over %s vectors...", n_lists, len(vectors)
+        )
+
+        self.centroids = self._train_centroids(vectors, n_lists)
+        assignments = self._assign(vectors, self.centroids)
+        self._fill_lists(vectors, assignments)
+        self.fingerprint = fingerprint or embeddings_fingerprint(embeddings)
+
+    def _train_centroids(self, vectors: np.ndarray, n_lists: int) -> np.ndarray:
+        rng = np.random.default_rng(2025)
+
+        sample_size = min(len(vectors), n_lists * 64)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(self.train_iterations):
+            assignments = self._assign(sample, centroids)
+
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=n_lists)
+
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+
+            centroids = normalize_rows(sums)
+
+        return centroids
+
+    def _assign(
+        self, vectors: np.ndarray, centroids: np.ndarray, block_size: int = 65536
+    ) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block_size):
+            block = vectors[start : start + block_size]
+            assignments[start : start + block_size] = np.argmax(
+                block @ centroids.T, axis=1
+            )
+        return assignments
+
+    def _fill_lists(self, vectors: np.ndarray, assignments: np.ndarray) -> None:
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=len(self.centroids))
+
+        self.list_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.list_ids = order.astype(np.int32)
+        self.list_vectors = np.ascontiguousarray(vectors[order])
+
+    def search(
+        self, queries: np.ndarray, k: int, n_probe: int = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        queries = normalize_rows(np.atleast_2d(queries))
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+
+        centroid_scores = queries @ self.centroids.T
+        probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+
+        results = []
+        for query, lists in zip(queries, probes):
+            starts = self.list_offsets[lists]
+            ends = self.list_offsets[lists + 1]
+
+            candidate_ids = np.concatenate(
+                [self.list_ids[s:e] for s, e in zip(starts, ends)]
+            )
+            candidate_scores = np.concatenate(
+                [self.list_vectors[s:e] @ query for s, e in zip(starts, ends)]
+            )
+
+            if len(self.extra_ids):
+                candidate_ids = np.concatenate((candidate_ids, self.extra_ids))
+                candidate_scores = np.concatenate(
+                    (
+                        candidate_scores,
+                        self.extra_vectors[: len(self.extra_ids)] @ query,
+                    )
+                )
+
+            best = top_k_indices(candidate_scores, k)
+            results.append(
+                (candidate_ids[best].astype(np.int64), candidate_scores[best])
+            )
+
+        return results
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        self.extra_vectors = append_rows(
+            self.extra_vectors, len(self.extra_ids), normalize_rows(vectors)
+        )
+        self.extra_ids = np.concatenate((self.extra_ids, ids)).astype(np.int64)
+
+    def save(self, filepath: str) -> None:
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        np.savez(
+            filepath,
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_ids=self.list_ids,
+            fingerprint=np.array(self.fingerprint),
+        )
+
+    def load(
+        self, filepath: str, embeddings: np.ndarray, fingerprint: str = None
+    ) -> bool:
+        if not os.path.exists(filepath):
+            return False
+
+        try:
+            data = np.load(filepath)
+            saved_fingerprint = str(data["fingerprint"])
+        except Exception:
+            return False
+
+        if saved_fingerprint != (fingerprint or embeddings_fingerprint(embeddings)):
+            return False
+
+        self.centroids = data["centroids"]
+        self.list_offsets = data["list_offsets"]
+        self.list_ids = data["list_ids"]
+        self.list_vectors = np.ascontiguousarray(
+            normalize_rows(embeddings)[self.list_ids]
+        )
+        self.fingerprint = saved_fingerprint
+        return True
+
+
+VECTOR_INDEXES = {"ivf": IVFIndex}
+
+
+def create_vector_index(kind: str):
+    if kind == "flat":
+        return None
+    if kind not in VECTOR_INDEXES:
+        raise ValueError(
+            f"Unknown vector index '{kind}' (available: flat, {', '.join(VECTOR_INDEXES)})"
+        )
+    return VECTOR_INDEXES[kind]()
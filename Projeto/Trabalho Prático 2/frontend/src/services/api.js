@@ -48,7 +48,7 @@ export const api = {
     }
   },
   
-  search: async (query, topK = 10) => {
+  search: async (query, topK = 10, filters = null) => {
     try {
       console.log(`Searching for "${query}" with top-k=${topK}`);
       const response = await fetch(`${API_BASE_URL}/api/search`, {
@@ -58,7 +58,8 @@ export const api = {
         },
         body: JSON.stringify({ 
           query,
-          top_k: topK
+          top_k: topK,
+          ...(filters ? { filters } : {})
         }),
       });
       